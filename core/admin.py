@@ -1,24 +1,54 @@
 from __future__ import absolute_import
 
+from django.conf import settings
 from django.conf.urls import url
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
 
+from core.analytics import business_filter_values
+from core.bulk import BULK_UPDATES, update_businesses
+from core.classifier import sector_classifier
+from core.filters import CAPITAL_BUCKET_QUERIES, SORT_FIELDS
+from core.forms import BusinessActionForm, BusinessUpdateForm
 from core.models import (
     Business,
     Amenity,
+    ImportJob,
+    PdfExportJob,
+    SectorClassifier,
     Sector_DTI_Files,
     Sector_DTI_NCCP,
     Status,
     Location,
 )
+from core.queries import estimate_count
+from core.references import reference_cache
+from core.roles import ROLE_STAFF, ROLE_SUPERUSER, ROLE_VIEWER, can_edit_businesses, user_role
+from core.search import search_businesses
 from core.views import (
+    bulk_update_businesses,
+    business_list_api,
     classify_business_to_sectors,
     upload_xls,
     export_excel,
     export_pdf,
+    queue_export_pdf,
     display_analytics,
+    display_analytics_cache_stats,
+    display_analytics_trends,
+    display_pareto_breakdown,
+    download_pdf_export,
 )
 
+# Changelists with more rows than this are counted from the planner's estimate
+ADMIN_EXACT_COUNT_LIMIT = getattr(settings, 'ADMIN_EXACT_COUNT_LIMIT', 10000)
+
+
 class AmenityInline(admin.TabularInline):
     model = Amenity
     extra = 1
@@ -34,58 +64,162 @@ class CapitalizationFilter(admin.SimpleListFilter):
     parameter_name = 'capital'
 
     def lookups(self, request, model_admin):
-        entries = [
-            ('micro', "Micro"),
-            ('small', "Small"),
-            ('medium', "Medium"),
-            ('large', "Large"),
-        ]
-        return entries
+        return [(bucket, label) for bucket, label, lookups in Business.CAPITAL_BUCKETS]
 
     def queryset(self, request, queryset):
-        if self.value():
-            if self.value() == 'micro':
-                return queryset.filter(capital__lt=3000000)
-            elif self.value() == 'small':
-                return queryset.filter(capital__gte=3000000,capital__lte=15000000)
-            elif self.value() == 'medium':
-                return queryset.filter(capital__gt=15000000,capital__lte=100000000)
-            elif self.value() == 'large':
-                return queryset.filter(capital__gt=100000000)
-            else:
-                return queryset
-        else:
-            return queryset
+        if self.value() in CAPITAL_BUCKET_QUERIES:
+            return queryset.filter(CAPITAL_BUCKET_QUERIES[self.value()])
+        return queryset
+
+
+class CachedValuesFieldListFilter(admin.AllValuesFieldListFilter):
+    '''
+    AllValuesFieldListFilter over the cached values of business_filter_values
+    instead of a SELECT DISTINCT over the businesses on every page view.
+    '''
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super(CachedValuesFieldListFilter, self).__init__(field, request, params, model, model_admin, field_path)
+        self.lookup_choices = business_filter_values(field.name)
+
+
+class CachedRelatedFieldListFilter(admin.RelatedFieldListFilter):
+    '''RelatedFieldListFilter listing the references from reference_cache instead of querying them on every page view.'''
+
+    def field_choices(self, field, request, model_admin):
+        return [(obj.pk, unicode(obj)) for obj in reference_cache.all(field.related_model)]
+
+
+class EstimatedCountPaginator(Paginator):
+    '''
+    Paginator that counts large result sets from the planner's row estimate.
+    The exact COUNT(*) costs as much as reading every row, and the page links
+    do not need it, so it is only run up to ADMIN_EXACT_COUNT_LIMIT rows.
+    '''
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate <= ADMIN_EXACT_COUNT_LIMIT:
+            return self.object_list.count()
+        return estimate
+
+
+class BusinessChangeList(ChangeList):
+    def get_queryset(self, request):
+        # Only the listed columns; the reference names come from reference_cache instead of joins
+        return super(BusinessChangeList, self).get_queryset(request).only('id', *SORT_FIELDS)
+
+
+def reference_column(model, field, description):
+    '''A changelist column showing the name of the `field` reference of a business.'''
+    def column(self, obj):
+        pk = getattr(obj, '{}_id'.format(field))
+        return reference_cache.get_by_id(model, pk).name if pk else None
+    column.short_description = description
+    column.admin_order_field = field
+    return column
+
+
+def bulk_update_action(action):
+    '''An admin action applying the BULK_UPDATES `action` to the selected businesses.'''
+    def update(self, request, queryset):
+        try:
+            value = BusinessUpdateForm(request.POST).value_for(action)
+        except ValidationError as error:
+            self.message_user(request, ' '.join(error.messages), messages.ERROR)
+            return
+
+        updated = update_businesses(queryset, action, value)
+        self.message_user(request, '{}: updated {} businesses.'.format(BULK_UPDATES[action][0], updated))
+    update.__name__ = str(action)
+    update.short_description = BULK_UPDATES[action][0]
+    return update
 
 
 class BusinessAdmin(admin.ModelAdmin):
     # Disabled fields for list display: 'section', 'division',
     # Disabled fields for list filter: 'division__section', 'division',
     list_display = ['taxpayer_name', 'business_name', 'tel_number', 'address', 'barangay', 'business_type', 'ownership_type',
-                    'capital', 'year','status', 'sector_dti_files', 'sector_dti_nccp', 'is_verified', ]
+                    'capital', 'year', 'status_name', 'sector_dti_files_name', 'sector_dti_nccp_name', 'is_verified', ]
+    list_select_related = ()
     inlines = [AmenityInline,]
     search_fields = ['taxpayer_name', 'business_name', 'address', 'barangay',
                      'capital', 'status__name', 'sector_dti_files__name', 'sector_dti_nccp__name',]
-    list_filter = ['business_type', 'ownership_type', CapitalizationFilter, 'year', 'status', 'sector_dti_files', 'sector_dti_nccp',
-                   'barangay', 'is_verified',]
-    ordering = ('taxpayer_name',)
+    list_filter = ['business_type', 'ownership_type', CapitalizationFilter, ('year', CachedValuesFieldListFilter),
+                   ('status', CachedRelatedFieldListFilter), ('sector_dti_files', CachedRelatedFieldListFilter),
+                   ('sector_dti_nccp', CachedRelatedFieldListFilter), ('barangay', CachedValuesFieldListFilter), 'is_verified',]
+    # The id makes the order deterministic without the admin's '-pk', matching the (taxpayer_name, id) index
+    ordering = ('taxpayer_name', 'id',)
     exclude = ('division',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    action_form = BusinessActionForm
+    actions = list(BULK_UPDATES)
+
+    status_name = reference_column(Status, 'status', 'Status')
+    sector_dti_files_name = reference_column(Sector_DTI_Files, 'sector_dti_files', 'Sector from DTI Files')
+    sector_dti_nccp_name = reference_column(Sector_DTI_NCCP, 'sector_dti_nccp', 'Sector from DTI-NCCP')
+
+    verify_businesses = bulk_update_action('verify_businesses')
+    unverify_businesses = bulk_update_action('unverify_businesses')
+    set_sector = bulk_update_action('set_sector')
+    set_status = bulk_update_action('set_status')
+    set_year = bulk_update_action('set_year')
+
+    def get_changelist(self, request, **kwargs):
+        return BusinessChangeList
+
+    def get_actions(self, request):
+        actions = super(BusinessAdmin, self).get_actions(request)
+        if not can_edit_businesses(request):
+            for action in BULK_UPDATES:
+                actions.pop(action, None)
+        return actions
 
     def get_readonly_fields(self, request, obj=None):
-        if request.user.is_superuser or request.user.groups.all()[0].name == 'Staff':
-            return self.readonly_fields
-        #get all fields as readonly
-        fields = [f.name for f in self.model._meta.fields]
-        return fields
+        return self.role_readonly_fields[user_role(request)]
+
+    @cached_property
+    def role_readonly_fields(self):
+        # Viewers get all fields as readonly
+        return {
+            ROLE_SUPERUSER: self.readonly_fields,
+            ROLE_STAFF: self.readonly_fields,
+            ROLE_VIEWER: tuple(f.name for f in self.model._meta.fields),
+        }
+
+    def get_search_results(self, request, queryset, search_term):
+        # Searches the full-text document instead of icontains over search_fields
+        return search_businesses(queryset, search_term), False
+
+    def save_related(self, request, form, formsets, change):
+        super(BusinessAdmin, self).save_related(request, form, formsets, change)
+
+        # Verified businesses are training samples for the sector classifier. As in
+        # core.bulk, partial_fit can add one but not move or remove it, which retrains.
+        changed = set(form.changed_data) & {'is_verified', 'sector_dti_nccp'}
+        if not changed:
+            return
+        if form.initial.get('is_verified'):
+            sector_classifier.invalidate()
+        elif form.instance.is_verified:
+            sector_classifier.learn_businesses([form.instance.id])
 
     def get_urls(self):
         urls = super(BusinessAdmin, self).get_urls()
         urlpatterns = [
             url(r'^upload/$', upload_xls, name="upload_excel"),
+            url(r'^api/$', self.admin_site.admin_view(business_list_api), name="business_list_api"),
             url(r'^analytics/$', display_analytics, name="display_analytics"),
+            url(r'^analytics/cache_stats/$', self.admin_site.admin_view(display_analytics_cache_stats), name="display_analytics_cache_stats"),
+            url(r'^analytics/trends/$', self.admin_site.admin_view(display_analytics_trends), name="display_analytics_trends"),
+            url(r'^analytics/pareto/(?P<dimension>\w+)/(?P<filters>.*)/$', self.admin_site.admin_view(display_pareto_breakdown), name="display_pareto_breakdown"),
             url(r'^analytics/(?P<year>.*)/$', display_analytics, name="display_analytics"),
             url(r'^export_excel/(?P<filters>.*)/$', export_excel, name="export_excel"),
             url(r'^export_pdf/(?P<filters>.*)/$', export_pdf, name="export_pdf"),
+            url(r'^bulk_update/(?P<filters>.*)/$', self.admin_site.admin_view(bulk_update_businesses), name="bulk_update_businesses"),
+            url(r'^queue_export_pdf/(?P<filters>.*)/$', self.admin_site.admin_view(queue_export_pdf), name="queue_export_pdf"),
             url(r'^classify_to_sectors/(?P<filters>.*)/$', classify_business_to_sectors, name="classify_business_to_sectors"),
         ]
         return urlpatterns + urls
@@ -136,6 +270,65 @@ class LocationAdmin(admin.ModelAdmin):
     list_display = ['establishment',]
     search_fields = ['establishment',]
 
+
+def requeue_jobs(modeladmin, request, queryset):
+    requeued = modeladmin.model.requeue(queryset.filter(state=modeladmin.model.STATE_FAILED))
+    modeladmin.message_user(request, 'Requeued {} failed jobs.'.format(requeued))
+requeue_jobs.short_description = 'Requeue the selected failed jobs'
+
+
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ['file_name', 'state', 'rows_processed', 'businesses_created', 'amenities_created',
+                    'error_count', 'duplicate_count', 'elapsed', 'worker', 'date_queued',]
+    fields = ['file_name', 'file', 'state', 'rows_processed', 'rows_committed', 'businesses_created',
+              'amenities_created', 'error_count', 'errors', 'duplicate_count', 'duplicates', 'worker', 'date_queued',
+              'date_started', 'date_finished', 'elapsed',]
+    readonly_fields = fields
+    list_filter = ['state',]
+    ordering = ('-date_queued',)
+    actions = [requeue_jobs]
+
+    def has_add_permission(self, request):
+        # Jobs are queued through the upload page
+        return False
+
+
+class PdfExportJobAdmin(admin.ModelAdmin):
+    list_display = ['__unicode__', 'filters', 'state', 'rows_exported', 'elapsed', 'download', 'date_queued',]
+    fields = ['filters', 'state', 'rows_exported', 'download', 'errors', 'worker', 'date_queued', 'date_started',
+              'date_finished', 'elapsed',]
+    readonly_fields = fields
+    list_filter = ['state',]
+    ordering = ('-date_queued',)
+    actions = [requeue_jobs]
+
+    def has_add_permission(self, request):
+        # Jobs are queued from the business list
+        return False
+
+    def download(self, obj):
+        if obj.state == PdfExportJob.STATE_DONE and obj.file:
+            return format_html('<a href="{}">Download PDF</a>', reverse('admin:core_pdfexportjob_download', args=(obj.id,)))
+        return ''
+    download.short_description = 'Download'
+
+    def get_urls(self):
+        urls = super(PdfExportJobAdmin, self).get_urls()
+        urlpatterns = [
+            url(r'^(?P<job_id>\d+)/download/$', self.admin_site.admin_view(download_pdf_export), name="core_pdfexportjob_download"),
+        ]
+        return urlpatterns + urls
+
+class SectorClassifierAdmin(admin.ModelAdmin):
+    list_display = ['__unicode__', 'training', 'training_samples', 'training_seconds', 'date_trained', 'is_stale',]
+    fields = list_display[1:] + ['file_name',]
+    readonly_fields = fields
+    ordering = ('-date_trained',)
+
+    def has_add_permission(self, request):
+        # Versions are saved by the classifier itself
+        return False
+
 # =============================================================================
 # Disabled admin sections: Section, Division
 # =============================================================================
@@ -144,5 +337,8 @@ admin.site.register(Sector_DTI_Files, Sector_DTI_FilesAdmin)
 admin.site.register(Sector_DTI_NCCP, Sector_DTI_NCCPAdmin)
 admin.site.register(Status, StatusAdmin)
 admin.site.register(Location, LocationAdmin)
+admin.site.register(ImportJob, ImportJobAdmin)
+admin.site.register(PdfExportJob, PdfExportJobAdmin)
+admin.site.register(SectorClassifier, SectorClassifierAdmin)
 # admin.site.register(Section, SectionAdmin)
 # admin.site.register(Division, DivisionAdmin)
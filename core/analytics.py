@@ -0,0 +1,403 @@
+from __future__ import unicode_literals
+
+from collections import defaultdict
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+
+from core.models import (
+    Business,
+    BusinessSummary,
+    Sector_DTI_Files,
+    Sector_DTI_NCCP,
+    Status,
+)
+from core.references import lock_reference, reference_cache
+from core.versions import bump_version, get_versions
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_USE_SUMMARY = getattr(settings, 'ANALYTICS_USE_SUMMARY', True)
+ANALYTICS_CACHE_TIMEOUT = getattr(settings, 'ANALYTICS_CACHE_TIMEOUT', None)
+TREND_BARANGAY_LIMIT = getattr(settings, 'TREND_BARANGAY_LIMIT', 20)
+
+ANALYTICS_DIMENSIONS = ('status', 'sector_dti_files', 'sector_dti_nccp', 'barangay', 'capital_bucket',)
+
+# One scan of the rows of a range of years, grouped by year and each dimension on its own
+GROUPED_COUNTS_SQL = """
+SELECT GROUPING(status_id), GROUPING(sector_dti_files_id), GROUPING(sector_dti_nccp_id), GROUPING(barangay),
+       GROUPING(capital_bucket), status_id, sector_dti_files_id, sector_dti_nccp_id, barangay, capital_bucket,
+       year, sum(weight)
+FROM (
+    SELECT year, status_id, sector_dti_files_id, sector_dti_nccp_id, barangay, capital_bucket, {weight} AS weight
+    FROM {table}
+    WHERE year BETWEEN %s AND %s
+) year_rows
+GROUP BY GROUPING SETS ((year, status_id), (year, sector_dti_files_id), (year, sector_dti_nccp_id), (year, barangay),
+                        (year, capital_bucket), (year))
+"""
+
+# Groups of a dimension with the most businesses first, with the running total
+# of the businesses up to each group and the total of all the businesses
+PARETO_SQL = """
+SELECT value, num_businesses, cumulative, total
+FROM (
+    SELECT value, num_businesses,
+           sum(CASE WHEN value IS NULL THEN 0 ELSE num_businesses END)
+               OVER (ORDER BY value IS NULL, num_businesses DESC, value ROWS UNBOUNDED PRECEDING)::bigint AS cumulative,
+           sum(num_businesses) OVER ()::bigint AS total
+    FROM ({grouped}) grouped (value, num_businesses)
+) ranked
+WHERE value IS NOT NULL AND (%s >= 1 OR cumulative < floor(total * %s))
+ORDER BY cumulative
+"""
+
+# Dimensions of pareto_breakdown, with the reference model naming the values of each
+PARETO_DIMENSIONS = {
+    'barangay': None,
+    'status': Status,
+    'sector_dti_files': Sector_DTI_Files,
+    'sector_dti_nccp': Sector_DTI_NCCP,
+}
+
+# Fields of the business changelist filters listed by business_filter_values
+FILTER_VALUE_FIELDS = ('year', 'barangay',)
+
+SUMMARY_COLUMNS = ('year', 'status_id', 'sector_dti_files_id', 'sector_dti_nccp_id', 'barangay', 'capital_bucket',
+                   'num_businesses',)
+SUMMARY_DIMENSIONS = SUMMARY_COLUMNS[:-1]
+
+# Years whose businesses changed in the current thread, refreshed when the transaction commits
+_changed = threading.local()
+
+
+def refresh_business_summary(years):
+    '''
+    Rebuilds the BusinessSummary rows of `years` from their businesses, with a
+    DELETE and an INSERT ... SELECT ... GROUP BY run entirely in the database.
+    '''
+    years = sorted(set(years))
+    if not years:
+        return
+
+    grouped = (Business.objects.filter(year__in=years)
+               .values('year', 'status', 'sector_dti_files', 'sector_dti_nccp', 'barangay', 'capital_bucket')
+               .annotate(num_businesses=Count('id'))
+               .order_by())
+    sql, params = grouped.query.sql_with_params()
+
+    with transaction.atomic():
+        # Concurrent refreshes of a year would otherwise both insert its rows
+        for year in years:
+            lock_reference(BusinessSummary, {'year': year})
+
+        BusinessSummary.objects.filter(year__in=years).delete()
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO {} ({}) {}'.format(
+                BusinessSummary._meta.db_table, ', '.join(SUMMARY_COLUMNS), sql), params)
+
+    logger.info('Refreshed the business summary of {}.'.format(', '.join(unicode(year) for year in years)))
+
+
+def rebuild_business_summary():
+    summary_years = BusinessSummary.objects.values_list('year', flat=True).distinct()
+    business_years = Business.objects.values_list('year', flat=True).distinct()
+    refresh_business_summary(set(summary_years) | set(business_years))
+
+
+def notify_businesses_changed(years):
+    '''
+    Marks the businesses of `years` as changed, for bulk writes that the
+    summary must follow: imports, reclassifications and bulk updates. The
+    summary of each year is refreshed once when the current transaction
+    commits, however many businesses of that year were written.
+    '''
+    pending = _changed.__dict__.setdefault('years', set())
+    pending.update(year for year in years if year is not None)
+    transaction.on_commit(_refresh_changed_years)
+
+
+def summary_key(business):
+    '''The SUMMARY_DIMENSIONS values of `business`, i.e. the summary row that counts it.'''
+    return tuple(getattr(business, dimension) for dimension in SUMMARY_DIMENSIONS)
+
+
+def count_business_change(old_key, new_key):
+    '''
+    Moves one business from the summary row of `old_key` to that of `new_key`,
+    each a summary_key or None for a created or deleted business. Single saves
+    and deletes adjust the two rows instead of refreshing whole years; a row
+    found out of step with the businesses has its year refreshed instead.
+    '''
+    if old_key == new_key:
+        return
+
+    changes = [(key, delta) for key, delta in ((old_key, -1), (new_key, 1)) if key is not None and key[0] is not None]
+    with transaction.atomic():
+        # The same lock as refresh_business_summary, in year order against deadlocks
+        for year in sorted(set(key[0] for key, delta in changes)):
+            lock_reference(BusinessSummary, {'year': year})
+
+        for key, delta in changes:
+            rows = BusinessSummary.objects.filter(**dict(
+                (dimension, value) if value is not None else ('{}__isnull'.format(dimension), True)
+                for dimension, value in zip(SUMMARY_DIMENSIONS, key)))
+            if rows.update(num_businesses=F('num_businesses') + delta):
+                rows.filter(num_businesses__lte=0).delete()
+            elif delta > 0:
+                BusinessSummary.objects.create(num_businesses=delta, **dict(zip(SUMMARY_DIMENSIONS, key)))
+            else:
+                notify_businesses_changed([key[0]])
+
+    pending = _changed.__dict__.setdefault('counted_years', set())
+    pending.update(key[0] for key, delta in changes)
+    transaction.on_commit(_refresh_changed_years)
+
+
+def _refresh_changed_years():
+    # Later callbacks of the same transaction find nothing left to refresh
+    years, _changed.years = getattr(_changed, 'years', set()), set()
+    counted_years, _changed.counted_years = getattr(_changed, 'counted_years', set()), set()
+    if not years | counted_years:
+        return
+    refresh_business_summary(years)
+    invalidate_analytics(years | counted_years)
+    cache.delete_many(['business-filter-values:{}'.format(field) for field in FILTER_VALUE_FIELDS])
+
+
+def summary_years():
+    return BusinessSummary.objects.values('year').distinct().order_by('-year')
+
+
+def business_filter_values(field):
+    '''
+    Returns the distinct values of the `field` of the businesses, a field of
+    FILTER_VALUE_FIELDS, read from the analytics rows and cached until the
+    summary of any year is refreshed.
+    '''
+    key = 'business-filter-values:{}'.format(field)
+    values = cache.get(key)
+    if values is None:
+        values = list(analytics_rows().values_list(field, flat=True).distinct().order_by(field))
+        cache.set(key, values, ANALYTICS_CACHE_TIMEOUT)
+    return values
+
+
+def year_analytics(year):
+    '''
+    Returns the breakdowns of the analytics page for `year`: the businesses per
+    sector, status and capital bucket, read with a single grouped query, and the
+    barangays holding the first half of its businesses.
+    '''
+    counts = grouped_counts(year, year).get(year) or empty_counts()
+
+    def breakdown(dimension, model):
+        return [{'name': reference_cache.get_by_id(model, pk).name, 'num_businesses': num_businesses}
+                for pk, num_businesses in counts[dimension]]
+
+    capital_counts = dict(counts['capital_bucket'])
+
+    return {
+        'sector_dti_files_data': breakdown('sector_dti_files', Sector_DTI_Files),
+        'sector_dti_nccp_data': breakdown('sector_dti_nccp', Sector_DTI_NCCP),
+        'status_data': breakdown('status', Status),
+        'barangay_data': pareto_breakdown(analytics_rows().filter(year=year), 'barangay'),
+        'capital_data': [{'capital': label, 'value': capital_counts[bucket]}
+                         for bucket, label, lookups in Business.CAPITAL_BUCKETS if capital_counts.get(bucket)],
+        'total': counts['total'],
+    }
+
+
+def trend_analytics(first_year, last_year, barangay_limit=TREND_BARANGAY_LIMIT):
+    '''
+    Returns the yearly series of businesses per status, sector, capital bucket
+    and barangay from `first_year` to `last_year`, with the total and the new
+    and renewal counts, read with a single grouped query. Every series is a
+    list of counts aligned with `years`; only the `barangay_limit` barangays
+    with the most businesses in the range are included.
+    '''
+    counts = grouped_counts(first_year, last_year)
+    years = sorted(counts)
+
+    def yearly(dimension, value):
+        return [dict(counts[year][dimension]).get(value, 0) for year in years]
+
+    def series(dimension, name, limit=None):
+        totals = defaultdict(int)
+        for year in years:
+            for value, num_businesses in counts[year][dimension]:
+                totals[value] += num_businesses
+        values = sorted(totals, key=lambda value: totals[value], reverse=True)[:limit]
+        return [{'name': name(value), 'counts': yearly(dimension, value)} for value in values]
+
+    def reference_name(model):
+        return lambda pk: reference_cache.get_by_id(model, pk).name
+
+    return {
+        'years': years,
+        'total': [counts[year]['total'] for year in years],
+        'new': yearly('status', Status.NEW),
+        'renewal': yearly('status', Status.RENEWAL),
+        'status': series('status', reference_name(Status)),
+        'sector_dti_files': series('sector_dti_files', reference_name(Sector_DTI_Files)),
+        'sector_dti_nccp': series('sector_dti_nccp', reference_name(Sector_DTI_NCCP)),
+        'capital': [{'name': label, 'counts': yearly('capital_bucket', bucket)}
+                    for bucket, label, lookups in Business.CAPITAL_BUCKETS],
+        'barangay': series('barangay', lambda barangay: barangay, barangay_limit),
+    }
+
+
+def pareto_breakdown(businesses, dimension, share=0.5):
+    '''
+    Returns the groups of `dimension` (one of PARETO_DIMENSIONS) that together
+    hold less than `share` of `businesses`, most businesses first, computed in
+    the database with window functions. `businesses` is any filtered queryset
+    of Business, or of BusinessSummary rows, whose num_businesses is summed.
+    A share of 1 returns every group, with its cumulative percent of the total.
+    Businesses without a value count toward the total but form no group.
+    '''
+    if dimension not in PARETO_DIMENSIONS:
+        raise ValueError('{} is not an analytics dimension.'.format(dimension))
+
+    count = Sum('num_businesses') if businesses.model is BusinessSummary else Count('id')
+    grouped = businesses.order_by().values_list(dimension).annotate(num_businesses=count)
+    sql, params = grouped.query.sql_with_params()
+
+    with connection.cursor() as cursor:
+        cursor.execute(PARETO_SQL.format(grouped=sql), list(params) + [share, share])
+        rows = cursor.fetchall()
+
+    model = PARETO_DIMENSIONS[dimension]
+    return [{
+        dimension: value,
+        'name': reference_cache.get_by_id(model, value).name if model else value,
+        'num_businesses': num_businesses,
+        'percent_from_total': float(num_businesses) / total * 100,
+        'cumulative_percent': float(cumulative) / total * 100,
+    } for value, num_businesses, cumulative, total in rows]
+
+
+def analytics_rows():
+    '''The rows the analytics count: the business summary, or the businesses when ANALYTICS_USE_SUMMARY is off.'''
+    return BusinessSummary.objects.all() if ANALYTICS_USE_SUMMARY else Business.objects.all()
+
+
+def empty_counts():
+    counts = dict((dimension, []) for dimension in ANALYTICS_DIMENSIONS)
+    counts['total'] = 0
+    return counts
+
+
+def grouped_counts(first_year, last_year):
+    '''
+    Counts the businesses of every year from `first_year` to `last_year` per
+    value of every analytics dimension, in one scan of the business summary
+    (or of the businesses themselves when ANALYTICS_USE_SUMMARY is off) using
+    GROUPING SETS. Returns, per year, the (value, count) pairs of each
+    dimension, most businesses first and without NULL values, and the total.
+    '''
+    if ANALYTICS_USE_SUMMARY:
+        table, weight = BusinessSummary._meta.db_table, 'num_businesses'
+    else:
+        table, weight = Business._meta.db_table, '1'
+
+    with connection.cursor() as cursor:
+        cursor.execute(GROUPED_COUNTS_SQL.format(table=table, weight=weight), [first_year, last_year])
+        rows = cursor.fetchall()
+
+    counts = defaultdict(empty_counts)
+
+    for row in rows:
+        groupings, values, year, num_businesses = row[:5], row[5:10], row[10], row[11]
+        if all(groupings):
+            counts[year]['total'] = num_businesses
+            continue
+        index = groupings.index(0)
+        if values[index] is not None:
+            counts[year][ANALYTICS_DIMENSIONS[index]].append((values[index], num_businesses))
+
+    for year_counts in counts.values():
+        for dimension in ANALYTICS_DIMENSIONS:
+            year_counts[dimension].sort(key=lambda count: count[1], reverse=True)
+    return dict(counts)
+
+
+def cached_year_analytics(year):
+    '''
+    Returns year_analytics(year) from the cache, computing and caching it on
+    a miss. Entries are keyed by version numbers that invalidate_analytics
+    increments, so an entry computed while its year changed is never read.
+    '''
+    key = analytics_cache_key(year)
+    analytics = cache.get(key)
+
+    if analytics is None:
+        increment_cache_counter('analytics:misses')
+        analytics = year_analytics(year)
+        cache.set(key, analytics, ANALYTICS_CACHE_TIMEOUT)
+    else:
+        increment_cache_counter('analytics:hits')
+
+    return analytics
+
+
+def analytics_cache_key(year):
+    return analytics_cache_keys([year])[year]
+
+
+def analytics_cache_keys(years):
+    '''
+    Returns the cache key of the analytics of each of `years`, made of their
+    versions. The versions live in the database, where culling the cache
+    cannot reset them to an old value and bring back superseded entries.
+    '''
+    year_version_keys = dict((year, 'analytics:version:{}'.format(year)) for year in years)
+    versions = get_versions(['analytics:version'] + list(year_version_keys.values()))
+    return dict((year, 'analytics:{}:{}:{}'.format(versions['analytics:version'], year, versions[version_key]))
+                for year, version_key in year_version_keys.items())
+
+
+def invalidate_analytics(years=None):
+    '''
+    Drops the cached analytics of `years`, or of every year, e.g. when a sector
+    is renamed: their versions are bumped and the superseded entries deleted,
+    so they do not stay in the cache until it is culled.
+    '''
+    if years is None:
+        superseded = analytics_cache_keys(BusinessSummary.objects.values_list('year', flat=True).distinct())
+        bump_version('analytics:version')
+    else:
+        superseded = analytics_cache_keys(set(years))
+        for year in superseded:
+            bump_version('analytics:version:{}'.format(year))
+
+    cache.delete_many(list(superseded.values()))
+
+
+def increment_cache_counter(key):
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 1, None)
+
+
+def analytics_cache_stats():
+    '''
+    Returns the hits and misses of cached_year_analytics since the cache was
+    last cleared, counted across processes. The counters are not atomic on
+    every cache backend, so they are approximate under concurrent requests.
+    '''
+    counters = cache.get_many(['analytics:hits', 'analytics:misses'])
+    hits = counters.get('analytics:hits', 0)
+    misses = counters.get('analytics:misses', 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': float(hits) / (hits + misses) if hits + misses else None,
+    }
@@ -0,0 +1,101 @@
+from __future__ import unicode_literals
+
+import base64
+from collections import defaultdict
+import json
+
+from django.conf import settings
+
+from core.models import Amenity, Business, Sector_DTI_Files, Sector_DTI_NCCP, Status
+from core.queries import estimate_count
+from core.references import reference_cache
+
+API_PAGE_SIZE = getattr(settings, 'API_PAGE_SIZE', 100)
+API_MAX_PAGE_SIZE = getattr(settings, 'API_MAX_PAGE_SIZE', 1000)
+
+API_FIELDS = ('id', 'taxpayer_name', 'business_name', 'tel_number', 'address', 'barangay', 'business_type',
+              'ownership_type', 'capital', 'year', 'status_id', 'sector_dti_files_id', 'sector_dti_nccp_id',
+              'is_verified',)
+
+BUSINESS_TYPE_LABELS = dict(Business.BUSINESS_TYPE_CHOICES)
+OWNERSHIP_TYPE_LABELS = dict(Business.OWNERSHIP_TYPE_CHOICES)
+
+
+def encode_cursor(taxpayer_name, business_id):
+    return base64.urlsafe_b64encode(json.dumps([taxpayer_name, business_id]).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    '''Returns the (taxpayer_name, id) of a cursor made by encode_cursor, or raises ValueError.'''
+    try:
+        taxpayer_name, business_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        return taxpayer_name, int(business_id)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor.')
+
+
+def business_page(businesses, cursor=None, page_size=None):
+    '''
+    Returns one page of `businesses` in (taxpayer_name, id) order, as dicts with
+    their amenities and reference names, and the cursor of the next page, or
+    None on the last page. Pages start after the row of `cursor` instead of an
+    OFFSET, so every page is an index range scan however deep it is. Raises
+    ValueError for a page size below 1.
+    '''
+    if page_size is not None and page_size < 1:
+        raise ValueError('The page size must be at least 1.')
+    page_size = min(page_size or API_PAGE_SIZE, API_MAX_PAGE_SIZE)
+    businesses = businesses.order_by('taxpayer_name', 'id')
+
+    if cursor:
+        businesses = businesses.extra(
+            where=['("core_business"."taxpayer_name", "core_business"."id") > (%s, %s)'],
+            params=list(decode_cursor(cursor)),
+        )
+
+    # One row more than the page tells whether there is a next page
+    rows = list(businesses.values(*API_FIELDS)[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1]['taxpayer_name'], rows[-1]['id'])
+
+    amenities = defaultdict(list)
+    page_amenities = Amenity.objects.filter(establishment_id__in=[row['id'] for row in rows]).order_by('id')
+    for business_id, name in page_amenities.values_list('establishment_id', 'name'):
+        amenities[business_id].append(name)
+
+    return [serialize_business(row, amenities[row['id']]) for row in rows], next_cursor
+
+
+def serialize_business(row, amenities):
+    def reference_name(model, pk):
+        return reference_cache.get_by_id(model, pk).name if pk else None
+
+    return {
+        'id': row['id'],
+        'taxpayer_name': row['taxpayer_name'],
+        'business_name': row['business_name'],
+        'tel_number': row['tel_number'],
+        'address': row['address'],
+        'barangay': row['barangay'],
+        'business_type': BUSINESS_TYPE_LABELS.get(row['business_type']),
+        'ownership_type': OWNERSHIP_TYPE_LABELS.get(row['ownership_type']),
+        'capital': unicode(row['capital']) if row['capital'] is not None else None,
+        'year': row['year'],
+        'status': reference_name(Status, row['status_id']),
+        'sector_dti_files': reference_name(Sector_DTI_Files, row['sector_dti_files_id']),
+        'sector_dti_nccp': reference_name(Sector_DTI_NCCP, row['sector_dti_nccp_id']),
+        'is_verified': row['is_verified'],
+        'amenities': amenities,
+    }
+
+
+def business_list_payload(businesses, cursor=None, page_size=None):
+    results, next_cursor = business_page(businesses, cursor, page_size)
+    return {
+        'count': estimate_count(businesses),
+        'count_is_estimate': True,
+        'next_cursor': next_cursor,
+        'results': results,
+    }
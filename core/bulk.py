@@ -0,0 +1,53 @@
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+import logging
+
+from django.db import transaction
+
+from core.analytics import notify_businesses_changed
+from core.classifier import business_years, sector_classifier
+from core.listings import LISTING_REFERENCES, update_listing_names
+
+logger = logging.getLogger(__name__)
+
+# Bulk updates of the businesses: the description, the field set and its
+# value, or None for a value chosen in BusinessUpdateForm
+BULK_UPDATES = OrderedDict([
+    ('verify_businesses', ('Mark as verified', 'is_verified', True)),
+    ('unverify_businesses', ('Mark as not verified', 'is_verified', False)),
+    ('set_sector', ('Set the DTI-NCCP sector', 'sector_dti_nccp', None)),
+    ('set_status', ('Set the status', 'status', None)),
+    ('set_year', ('Set the year', 'year', None)),
+])
+
+
+def update_businesses(businesses, action, value=None):
+    '''
+    Applies the BULK_UPDATES `action` to every business of `businesses` with
+    one UPDATE, without loading them. Returns the number of businesses updated.
+    '''
+    description, field, fixed_value = BULK_UPDATES[action]
+    if fixed_value is not None:
+        value = fixed_value
+
+    with transaction.atomic():
+        years = business_years(businesses)
+        if field == 'year':
+            years.add(value)
+
+        # Verified businesses are training samples, which partial_fit cannot move or remove
+        retrain = field == 'is_verified' or (field == 'sector_dti_nccp' and businesses.filter(is_verified=True).exists())
+
+        # The update can take the businesses out of `businesses`, so their listings go first
+        if field in LISTING_REFERENCES:
+            update_listing_names(businesses, field, value)
+        updated = businesses.update(**{field: value})
+
+        if updated:
+            notify_businesses_changed(years)
+            if retrain:
+                sector_classifier.invalidate()
+
+    logger.info('{} ({}): updated {} businesses.'.format(description, value, updated))
+    return updated
@@ -0,0 +1,341 @@
+from __future__ import unicode_literals
+
+from collections import defaultdict, deque
+import logging
+import multiprocessing
+import os
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+
+import numpy as np
+from sklearn.externals import joblib
+from sklearn.feature_extraction.text import (
+    HashingVectorizer,
+    TfidfTransformer,
+)
+from sklearn.linear_model import SGDClassifier
+from sklearn.pipeline import Pipeline
+
+from core.analytics import notify_businesses_changed
+from core.listings import amenities_field, name_field, update_listing_names
+from core.models import (
+    Amenity,
+    Business,
+    Sector_DTI_NCCP,
+    Sector_DTI_NCCP_Dataset,
+    SectorClassifier,
+)
+from core.references import reference_cache
+
+logger = logging.getLogger(__name__)
+
+CLASSIFIER_DIR = getattr(settings, 'CLASSIFIER_DIR', os.path.join(settings.BASE_DIR, 'classifier'))
+CLASSIFIER_N_FEATURES = getattr(settings, 'CLASSIFIER_N_FEATURES', 2 ** 16)
+CLASSIFIER_FILES_KEPT = getattr(settings, 'CLASSIFIER_FILES_KEPT', 5)
+CLASSIFY_BATCH_SIZE = getattr(settings, 'CLASSIFY_BATCH_SIZE', 1000)
+
+
+def new_pipeline():
+    # The hashing vectorizer is stateless, so later samples can be added with partial_fit
+    # without refitting a vocabulary. The IDF weights stay as fitted on the full training set.
+    return Pipeline([('vect', HashingVectorizer(n_features=CLASSIFIER_N_FEATURES, non_negative=True, norm=None)),
+                     ('tfidf', TfidfTransformer()),
+                     ('clf', SGDClassifier(loss='hinge', penalty='l2',
+                                           alpha=1e-3, n_iter=5, random_state=42)),
+    ])
+
+
+def build_training_set():
+    '''
+    Returns the training texts and their Sector_DTI_NCCP ids: every dataset entry,
+    plus one document per sector joining the amenities of its verified businesses.
+    '''
+    data = []
+    target = []
+
+    for sector_id, text in Sector_DTI_NCCP_Dataset.objects.values_list('sector_dti_nccp_id', 'text'):
+        data.append(text)
+        target.append(sector_id)
+
+    amenities = defaultdict(list)
+    verified_amenities = Amenity.objects.filter(establishment__is_verified=True, establishment__sector_dti_nccp__isnull=False)
+    for sector_id, name in verified_amenities.values_list('establishment__sector_dti_nccp_id', 'name'):
+        amenities[sector_id].append(name)
+
+    for sector in reference_cache.all(Sector_DTI_NCCP):
+        data.append(" ".join(amenities[sector.id]))
+        target.append(sector.id)
+
+    return data, np.array(target)
+
+
+class SectorClassifierRegistry(object):
+    '''
+    Keeps the DTI-NCCP sector classifier trained once and saved with joblib under
+    CLASSIFIER_DIR. Every SectorClassifier row is one saved version; each process
+    loads the latest version lazily and reloads it when a newer one is saved.
+    '''
+
+    def __init__(self):
+        self._version = None
+        self._pipeline = None
+
+    def latest(self):
+        '''Returns the SectorClassifier row of the version in use, training one if needed.'''
+        latest = SectorClassifier.objects.order_by('-id').first()
+        if latest is None or latest.is_stale:
+            latest = self.train()
+        return latest
+
+    def get(self):
+        return self._load(self.latest())
+
+    def predict(self, texts):
+        '''Returns the predicted Sector_DTI_NCCP id of every text.'''
+        return self.get().predict(texts)
+
+    def train(self):
+        started = time.time()
+        data, target = build_training_set()
+
+        pipeline = new_pipeline()
+        pipeline.fit(data, target)
+
+        return self._save(pipeline, SectorClassifier.TRAINING_FULL, len(data), time.time() - started)
+
+    def update(self, texts, sector_ids):
+        '''
+        Adds samples to the latest classifier with partial_fit and saves the result
+        as a new version. A sample of a sector the classifier has not seen marks it
+        stale instead, so it is fully retrained the next time it is used.
+        '''
+        if not len(texts):
+            return None
+
+        with transaction.atomic():
+            latest = SectorClassifier.objects.select_for_update().order_by('-id').first()
+            if latest is None or latest.is_stale:
+                return None
+
+            started = time.time()
+            pipeline = self._load(latest)
+            classifier = pipeline.named_steps['clf']
+
+            if not set(sector_ids) <= set(classifier.classes_):
+                self.invalidate()
+                return None
+
+            features = Pipeline(pipeline.steps[:-1]).transform(texts)
+            classifier.partial_fit(features, sector_ids)
+
+            return self._save(pipeline, SectorClassifier.TRAINING_UPDATE, len(texts), time.time() - started)
+
+    def learn_businesses(self, business_ids):
+        '''Updates the classifier with the amenities of verified businesses.'''
+        amenities = defaultdict(list)
+        verified_amenities = Amenity.objects.filter(
+            establishment__in=business_ids,
+            establishment__is_verified=True,
+            establishment__sector_dti_nccp__isnull=False
+        )
+        for business_id, sector_id, name in verified_amenities.values_list('establishment_id', 'establishment__sector_dti_nccp_id', 'name'):
+            amenities[(business_id, sector_id)].append(name)
+
+        return self.update(
+            [" ".join(names) for names in amenities.values()],
+            [sector_id for business_id, sector_id in amenities.keys()]
+        )
+
+    def invalidate(self):
+        SectorClassifier.objects.filter(is_stale=False).update(is_stale=True)
+
+    def _load(self, record):
+        if record.id != self._version:
+            self._pipeline = load_pipeline(record)
+            self._version = record.id
+        return self._pipeline
+
+    def _save(self, pipeline, training, training_samples, training_seconds):
+        if not os.path.exists(CLASSIFIER_DIR):
+            os.makedirs(CLASSIFIER_DIR)
+
+        record = SectorClassifier.objects.create(
+            training=training,
+            training_samples=training_samples,
+            training_seconds=training_seconds,
+        )
+        record.file_name = 'sector-classifier-{}.pkl'.format(record.id)
+        joblib.dump(pipeline, os.path.join(CLASSIFIER_DIR, record.file_name))
+        record.save(update_fields=['file_name'])
+
+        self._pipeline = pipeline
+        self._version = record.id
+
+        # Only the latest files are kept; the rows remain as the training history
+        for old_record in SectorClassifier.objects.order_by('-id')[CLASSIFIER_FILES_KEPT:]:
+            old_path = os.path.join(CLASSIFIER_DIR, old_record.file_name)
+            if old_record.file_name and os.path.exists(old_path):
+                os.remove(old_path)
+
+        logger.info('Saved sector classifier version {} ({}, {} samples in {:.2f}s).'.format(
+            record.id, record.get_training_display(), training_samples, training_seconds))
+
+        return record
+
+
+def load_pipeline(record):
+    return joblib.load(os.path.join(CLASSIFIER_DIR, record.file_name))
+
+
+sector_classifier = SectorClassifierRegistry()
+
+
+def iter_business_chunks(businesses, chunk_size):
+    '''
+    Yields lists of (id, sector_dti_files name) rows of `businesses`, with the
+    amenities as a third column when they are read from the listings, paging
+    by id so that only one chunk of a very large selection is in memory at a time.
+    '''
+    fields = ['id', name_field('sector_dti_files')]
+    if amenities_field():
+        fields.append(amenities_field())
+    rows = businesses.order_by('id').values_list(*fields)
+    last_id = 0
+
+    while True:
+        business_rows = list(rows.filter(id__gt=last_id)[:chunk_size])
+        if not business_rows:
+            break
+        last_id = business_rows[-1][0]
+        yield business_rows
+
+
+def business_texts(business_rows):
+    '''
+    Returns the text classified for each row of iter_business_chunks: the
+    names of its amenities, fetched for all the rows in one query unless the
+    rows carry them, and its sector from the DTI files.
+    '''
+    if amenities_field():
+        return ["{} {}".format(names or "", sector_name or "") for business_id, sector_name, names in business_rows]
+
+    amenities = defaultdict(list)
+    business_amenities = Amenity.objects.filter(establishment_id__in=[business_id for business_id, sector_name in business_rows])
+    for business_id, name in business_amenities.values_list('establishment_id', 'name'):
+        amenities[business_id].append(name)
+
+    return ["{} {}".format(" ".join(amenities[business_id]), sector_name or "")
+            for business_id, sector_name in business_rows]
+
+
+def business_years(businesses):
+    return set(businesses.order_by().values_list('year', flat=True).distinct())
+
+
+def save_predictions(business_ids, predicted):
+    '''
+    Writes predicted sectors with one UPDATE of sector_dti_nccp per sector.
+    Returns the number of businesses assigned to each sector id.
+    '''
+    by_sector = defaultdict(list)
+    for business_id, sector_id in zip(business_ids, predicted):
+        by_sector[sector_id].append(business_id)
+
+    with transaction.atomic():
+        for sector_id, sector_business_ids in by_sector.items():
+            sector_businesses = Business.objects.filter(id__in=sector_business_ids)
+            update_listing_names(sector_businesses, 'sector_dti_nccp', sector_id)
+            sector_businesses.update(sector_dti_nccp=sector_id)
+
+    return dict((sector_id, len(sector_business_ids)) for sector_id, sector_business_ids in by_sector.items())
+
+
+def classify_businesses(businesses, batch_size=None):
+    '''
+    Predicts the DTI-NCCP sector of `businesses` `batch_size` rows at a time and
+    saves each batch with grouped UPDATEs. Returns the number of businesses classified.
+    '''
+    batch_size = batch_size or CLASSIFY_BATCH_SIZE
+    sectors = dict((sector.id, sector) for sector in reference_cache.all(Sector_DTI_NCCP))
+    years = business_years(businesses)
+    classified = 0
+
+    try:
+        for business_rows in iter_business_chunks(businesses, batch_size):
+            business_ids = [row[0] for row in business_rows]
+            predicted = sector_classifier.predict(business_texts(business_rows))
+
+            for sector_id, sector_count in save_predictions(business_ids, predicted).items():
+                logger.info('{} businesses assigned to {}: \'{}\''.format(sector_count, sectors[sector_id].code, sectors[sector_id].name))
+
+            classified += len(business_rows)
+    finally:
+        notify_businesses_changed(years)
+
+    return classified
+
+
+# Pipeline loaded once by each process of the prediction pool
+_worker_pipeline = None
+
+
+def _init_prediction_worker(record):
+    global _worker_pipeline
+    _worker_pipeline = load_pipeline(record)
+
+
+def _predict_chunk(business_ids, texts):
+    return business_ids, list(_worker_pipeline.predict(texts))
+
+
+def classify_businesses_in_parallel(businesses, processes=None, chunk_size=None):
+    '''
+    Classifies `businesses` chunk by chunk across a pool of `processes` worker
+    processes (one per core by default). The main process pages through the
+    businesses and writes each chunk's predictions as soon as they come back,
+    keeping at most two chunks per worker in flight. Returns the number of
+    businesses classified.
+    '''
+    processes = processes or multiprocessing.cpu_count()
+    chunk_size = chunk_size or CLASSIFY_BATCH_SIZE
+    record = sector_classifier.latest()
+    years = business_years(businesses)
+
+    # The pool is forked, so it must not inherit the open database connections
+    connections.close_all()
+    pool = multiprocessing.Pool(processes, initializer=_init_prediction_worker, initargs=(record,))
+
+    started = time.time()
+    classified = 0
+    in_flight = deque()
+
+    def save_next_result():
+        business_ids, predicted = in_flight.popleft().get()
+        save_predictions(business_ids, predicted)
+        return len(business_ids)
+
+    try:
+        for business_rows in iter_business_chunks(businesses, chunk_size):
+            business_ids = [row[0] for row in business_rows]
+            in_flight.append(pool.apply_async(_predict_chunk, (business_ids, business_texts(business_rows))))
+
+            if len(in_flight) >= processes * 2:
+                classified += save_next_result()
+                logger.info('Classified {} businesses ({:.1f} businesses/sec).'.format(
+                    classified, classified / (time.time() - started)))
+
+        while in_flight:
+            classified += save_next_result()
+
+    finally:
+        pool.terminate()
+        pool.join()
+        notify_businesses_changed(years)
+
+    elapsed = time.time() - started
+    logger.info('Classified {} businesses in {:.2f}s with {} processes ({:.1f} businesses/sec).'.format(
+        classified, elapsed, processes, classified / elapsed if elapsed else 0))
+
+    return classified
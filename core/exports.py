@@ -0,0 +1,195 @@
+from __future__ import unicode_literals
+
+from itertools import count, islice
+import os
+import shutil
+import string
+import tempfile
+
+from django.conf import settings
+from django.db.models import Max
+from django.db.models.functions import Length
+
+from easy_pdf.rendering import render_to_pdf
+from PyPDF2 import PdfFileMerger
+from xlsxwriter.workbook import Workbook
+
+from core.listings import name_field
+from core.models import Business
+from core.queries import iterate_server_side
+
+EXPORT_COLUMNS = ["Taxpayer's Name", "Business Name", "Telephone Number", "Business Address",
+                  "Barangay", "Type of Business", "Type of Business Ownership", "Capital",
+                  "Year Issued", "Status", "Sector From DTI Files", "Sector From DTI-NCCP"
+]
+
+CAPITAL_COLUMN = 7
+
+EXPORT_PDF_CHUNK_SIZE = getattr(settings, 'EXPORT_PDF_CHUNK_SIZE', 500)
+
+# PdfFileMerger keeps every appended file open until it writes, so at most this many parts are merged at once
+EXPORT_PDF_MERGE_FILES = getattr(settings, 'EXPORT_PDF_MERGE_FILES', 64)
+
+
+# Projected in the column order of EXPORT_COLUMNS, so no model instances or joins per row are needed
+EXPORT_FIELDS = ('taxpayer_name', 'business_name', 'tel_number', 'address', 'barangay', 'business_type',
+                 'ownership_type', 'capital', 'year', name_field('status'), name_field('sector_dti_files'),
+                 name_field('sector_dti_nccp'),)
+
+BUSINESS_TYPE_LABELS = dict(Business.BUSINESS_TYPE_CHOICES)
+OWNERSHIP_TYPE_LABELS = dict(Business.OWNERSHIP_TYPE_CHOICES)
+
+
+def iter_business_rows(businesses):
+    '''
+    Yields the export rows of `businesses` from a single projected query read
+    through a server-side cursor, resolving the choice labels in Python.
+    '''
+    for values in iterate_server_side(businesses.values_list(*EXPORT_FIELDS)):
+        (taxpayer_name, business_name, tel_number, address, barangay, business_type, ownership_type,
+         capital, year, status, sector_dti_files, sector_dti_nccp) = values
+        yield [
+            taxpayer_name,
+            business_name,
+            tel_number,
+            address,
+            barangay,
+            BUSINESS_TYPE_LABELS.get(business_type, business_type) if business_type else "",
+            OWNERSHIP_TYPE_LABELS.get(ownership_type, ownership_type) if ownership_type else "",
+            capital,
+            year,
+            status or "",
+            sector_dti_files or "",
+            sector_dti_nccp or "",
+        ]
+
+
+def export_column_widths(businesses):
+    '''
+    Returns the width of every export column, taken from the longest value of
+    each column in a single aggregate query instead of measuring every row.
+    '''
+    longest = businesses.aggregate(
+        taxpayer_name=Max(Length('taxpayer_name')),
+        business_name=Max(Length('business_name')),
+        tel_number=Max(Length('tel_number')),
+        address=Max(Length('address')),
+        barangay=Max(Length('barangay')),
+        capital=Max('capital'),
+        year=Max('year'),
+        status=Max(Length(name_field('status'))),
+        sector_dti_files=Max(Length(name_field('sector_dti_files'))),
+        sector_dti_nccp=Max(Length(name_field('sector_dti_nccp'))),
+    )
+
+    value_widths = [
+        longest['taxpayer_name'],
+        longest['business_name'],
+        longest['tel_number'],
+        longest['address'],
+        longest['barangay'],
+        max(len(label) for value, label in Business.BUSINESS_TYPE_CHOICES),
+        max(len(label) for value, label in Business.OWNERSHIP_TYPE_CHOICES),
+        len('Php {:,.2f}'.format(longest['capital'])) if longest['capital'] is not None else 0,
+        len(unicode(longest['year'])) if longest['year'] is not None else 0,
+        longest['status'],
+        longest['sector_dti_files'],
+        longest['sector_dti_nccp'],
+    ]
+    return [max(len(column), width or 0) for column, width in zip(EXPORT_COLUMNS, value_widths)]
+
+
+def write_business_workbook(output, businesses):
+    '''
+    Writes the list of businesses as an .xlsx workbook to `output`, a filename or
+    file object. The worksheet is written in xlsxwriter's constant_memory mode,
+    which flushes every row to disk as soon as the next one starts.
+    '''
+    book = Workbook(output, {'constant_memory': True})
+    sheet = book.add_worksheet('LIST OF BUSINESSES')
+
+    bold = book.add_format({'bold': True})
+    money = book.add_format({'num_format': '"Php" #,##0.00'})
+
+    for column, width in enumerate(export_column_widths(businesses)):
+        column_letter = string.ascii_uppercase[column]
+        sheet.set_column('{0}:{0}'.format(column_letter), width)
+
+    sheet.write(0, 0, 'LIST OF BUSINESSES', bold)
+    for item in xrange(0,len(EXPORT_COLUMNS)):
+        sheet.write(2, item, EXPORT_COLUMNS[item],bold)
+
+    for index, business_object in enumerate(iter_business_rows(businesses)):
+        for object_index in xrange(len(business_object)):
+            if object_index == CAPITAL_COLUMN:
+                sheet.write(index+3,object_index,business_object[object_index], money)
+            else:
+                sheet.write(index+3,object_index,business_object[object_index])
+
+    sheet.protect()
+    book.close()
+
+
+def merge_pdf_files(paths, output, part_dir):
+    '''
+    Joins the PDF files `paths` into `output`. Longer lists are merged
+    EXPORT_PDF_MERGE_FILES files at a time into intermediate files in
+    `part_dir`, so no more than that many files are ever open.
+    '''
+    while len(paths) > EXPORT_PDF_MERGE_FILES:
+        merged_paths = []
+        for start in range(0, len(paths), EXPORT_PDF_MERGE_FILES):
+            merged_fd, merged_path = tempfile.mkstemp(suffix='.pdf', dir=part_dir)
+            with os.fdopen(merged_fd, 'wb') as merged:
+                merge_pdf_files(paths[start:start + EXPORT_PDF_MERGE_FILES], merged, part_dir)
+            merged_paths.append(merged_path)
+        for path in paths:
+            os.remove(path)
+        paths = merged_paths
+
+    merger = PdfFileMerger()
+    try:
+        for path in paths:
+            merger.append(path)
+        merger.write(output)
+    finally:
+        merger.close()
+
+
+def write_business_pdf(output, businesses, chunk_size=None):
+    '''
+    Renders pdf/pdf_business_list.html for `chunk_size` businesses at a time and
+    joins the rendered parts into one PDF written to `output`. The parts are
+    merged from files in a temporary directory, so only one chunk is ever
+    rendered in memory. Returns the number of businesses written.
+    '''
+    chunk_size = chunk_size or EXPORT_PDF_CHUNK_SIZE
+    rows = iter_business_rows(businesses)
+    part_dir = tempfile.mkdtemp(prefix='sordas-pdf-')
+    part_paths = []
+    business_count = 0
+
+    try:
+        for part_number in count():
+            business_list = list(islice(rows, chunk_size))
+            if not business_list and part_number:
+                break
+
+            for business_object in business_list:
+                capital = business_object[CAPITAL_COLUMN]
+                business_object[CAPITAL_COLUMN] = unicode('Php {:,.2f}'.format(capital)) if capital else ""
+
+            part_path = os.path.join(part_dir, '{}.pdf'.format(part_number))
+            with open(part_path, 'wb') as part:
+                part.write(render_to_pdf('pdf/pdf_business_list.html', {'business_list': business_list}))
+            part_paths.append(part_path)
+            business_count += len(business_list)
+
+            if len(business_list) < chunk_size:
+                break
+
+        merge_pdf_files(part_paths, output, part_dir)
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
+
+    return business_count
@@ -0,0 +1,188 @@
+from __future__ import unicode_literals
+
+import logging
+from urlparse import parse_qsl
+
+from django.contrib.admin.options import IS_POPUP_VAR, TO_FIELD_VAR
+from django.contrib.admin.views.main import ALL_VAR, ERROR_FLAG, PAGE_VAR
+from django.db.models import Q
+from django.utils.encoding import force_bytes, force_text
+
+from core.models import Business
+from core.search import search_businesses
+
+logger = logging.getLogger(__name__)
+
+CAPITAL_BUCKET_QUERIES = dict((bucket, Q(capital_bucket=bucket)) for bucket, label, lookups in Business.CAPITAL_BUCKETS)
+
+# Sortable columns, in the order of BusinessAdmin.list_display that the 'o' parameter indexes
+SORT_FIELDS = ['taxpayer_name', 'business_name', 'tel_number', 'address', 'barangay', 'business_type',
+               'ownership_type', 'capital', 'year', 'status', 'sector_dti_files', 'sector_dti_nccp', 'is_verified',]
+
+# Changelist parameters that do not filter the businesses: the page, show all,
+# the invalid-filters flag and those of raw id and related-object popups
+IGNORED_PARAMETERS = (PAGE_VAR, ALL_VAR, ERROR_FLAG, IS_POPUP_VAR, TO_FIELD_VAR,)
+
+
+class InvalidFilters(ValueError):
+    pass
+
+
+def choice_value(choices):
+    values = set(value for value, label in choices)
+
+    def convert(value):
+        value = int(value)
+        if value not in values:
+            raise ValueError('{} is not a valid choice.'.format(value))
+        return value
+    return convert
+
+
+def boolean_value(value):
+    # BooleanFieldListFilter uses 1/0 and the null filters True/False
+    if value in ('1', 'True'):
+        return True
+    if value in ('0', 'False'):
+        return False
+    raise ValueError('{} is not a boolean.'.format(value))
+
+
+# Filter parameters of the business changelist, with the ORM lookup and value type of each
+FILTER_PARAMETERS = {
+    'business_type__exact': ('business_type', choice_value(Business.BUSINESS_TYPE_CHOICES)),
+    'ownership_type__exact': ('ownership_type', choice_value(Business.OWNERSHIP_TYPE_CHOICES)),
+    'year': ('year', int),
+    'status__id__exact': ('status_id', int),
+    'status__isnull': ('status__isnull', boolean_value),
+    'sector_dti_files__id__exact': ('sector_dti_files_id', int),
+    'sector_dti_files__isnull': ('sector_dti_files__isnull', boolean_value),
+    'sector_dti_nccp__id__exact': ('sector_dti_nccp_id', int),
+    'sector_dti_nccp__isnull': ('sector_dti_nccp__isnull', boolean_value),
+    'barangay': ('barangay', unicode),
+    'barangay__isnull': ('barangay__isnull', boolean_value),
+    'is_verified__exact': ('is_verified', boolean_value),
+}
+
+
+class FilterSpec(object):
+    '''
+    The validated filters of the business list, parsed once from the query
+    string of the business changelist. A spec is immutable and hashable: the
+    same filters give equal specs whatever the order or encoding of the
+    parameters.
+    '''
+
+    def __init__(self, lookups=(), capital=None, query=None, ordering=()):
+        self.lookups = tuple(sorted(lookups))
+        self.capital = capital
+        self.query = query
+        self.ordering = tuple(ordering)
+
+    @classmethod
+    def parse(cls, filters):
+        '''Parses a changelist query string such as "year=2016&capital=micro&o=2.-1".'''
+        lookups = []
+        capital = None
+        query = None
+        ordering = ()
+        seen = set()
+
+        for parameter, value in parse_qsl(force_bytes(filters).strip(b'?')):
+            parameter = force_text(parameter)
+            value = force_text(value)
+
+            if parameter in seen:
+                raise InvalidFilters('Filter \'{}\' is given more than once.'.format(parameter))
+            seen.add(parameter)
+
+            if parameter in IGNORED_PARAMETERS:
+                continue
+            if parameter not in FILTER_PARAMETERS and parameter not in ('capital', 'q', 'o'):
+                raise InvalidFilters('Unknown filter \'{}\'.'.format(parameter))
+
+            try:
+                if parameter == 'capital':
+                    if value not in CAPITAL_BUCKET_QUERIES:
+                        raise ValueError('{} is not a capitalization.'.format(value))
+                    capital = value
+                elif parameter == 'q':
+                    query = value
+                elif parameter == 'o':
+                    ordering = parse_ordering(value)
+                else:
+                    lookup, convert = FILTER_PARAMETERS[parameter]
+                    lookups.append((lookup, convert(value)))
+            except ValueError as error:
+                raise InvalidFilters('Invalid value for filter \'{}\': {}'.format(parameter, error))
+
+        return cls(lookups, capital, query, ordering)
+
+    def _key(self):
+        return (self.lookups, self.capital, self.query, self.ordering)
+
+    def __eq__(self, other):
+        return isinstance(other, FilterSpec) and self._key() == other._key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return 'FilterSpec(lookups={!r}, capital={!r}, query={!r}, ordering={!r})'.format(*self._key())
+
+    def __nonzero__(self):
+        return any(self._key())
+
+    def to_q(self):
+        '''Returns the lookups and capitalization as one combined Q object.'''
+        q = Q(**dict(self.lookups))
+        if self.capital:
+            q &= CAPITAL_BUCKET_QUERIES[self.capital]
+        return q
+
+    def filter(self, businesses):
+        '''Filters `businesses` by the spec without ordering them.'''
+        businesses = businesses.filter(self.to_q())
+        if self.query:
+            businesses = search_businesses(businesses, self.query)
+        return businesses
+
+    def apply(self, businesses):
+        businesses = self.filter(businesses)
+
+        if self.ordering:
+            return businesses.order_by(*self.ordering)
+        if self.query:
+            return businesses.order_by('-search_rank', 'taxpayer_name')
+        return businesses.order_by('taxpayer_name')
+
+
+def parse_ordering(value):
+    '''Returns the order_by() fields of an 'o' parameter, e.g. "2.-1" for business name, then taxpayer descending.'''
+    ordering = []
+    for index in value.split('.'):
+        if not index:
+            continue
+        position = int(index)
+        if not 0 < abs(position) <= len(SORT_FIELDS):
+            raise ValueError('{} is not a sortable column.'.format(position))
+        field = SORT_FIELDS[abs(position) - 1]
+        ordering.append(field if position > 0 else '-{}'.format(field))
+    return ordering
+
+
+def filter_businesses(business_list, filters):
+    '''
+    Filters and orders `business_list` by `filters`, a FilterSpec or a
+    changelist query string. Raises InvalidFilters for invalid filters.
+    '''
+    if not isinstance(filters, FilterSpec):
+        filters = FilterSpec.parse(filters)
+
+    if filters:
+        logger.info("Filtering the list of businesses according to {!r}".format(filters))
+
+    return filters.apply(business_list)
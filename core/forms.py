@@ -1,15 +1,53 @@
+from django.contrib.admin.helpers import ActionForm
 from django.core.exceptions import ValidationError
 from django.utils.translation import ugettext_lazy as _
 from django import forms
 
+from core.bulk import BULK_UPDATES
+from core.models import Sector_DTI_NCCP, Status
+from core.references import reference_cache
+
 
 class UploadExcelFileForm(forms.Form):
     file = forms.FileField(label = (_("Choose the Excel file to upload:")))
 
     def clean_file(self):
         file = self.cleaned_data.get('file')
-        if not file.name.endswith('.xls'):
+        if not file.name.lower().endswith(('.xls', '.xlsx')):
             raise ValidationError(_
-                ('Only .xls files are accepted.'),
+                ('Only .xls and .xlsx files are accepted.'),
                 code ='invalid'
             )
+        return file
+
+
+def reference_choices(model):
+    def choices():
+        return [('', '---------')] + [(obj.pk, obj.name) for obj in reference_cache.all(model)]
+    return choices
+
+
+class BusinessUpdateForm(forms.Form):
+    '''The values chosen for the bulk updates of core.bulk that set a status, sector or year.'''
+    sector_dti_nccp = forms.TypedChoiceField(label=_("DTI-NCCP sector"), choices=reference_choices(Sector_DTI_NCCP),
+                                             coerce=int, empty_value=None, required=False)
+    status = forms.TypedChoiceField(label=_("Status"), choices=reference_choices(Status),
+                                    coerce=int, empty_value=None, required=False)
+    year = forms.IntegerField(label=_("Year"), min_value=1, required=False)
+
+    def value_for(self, action):
+        '''Returns the value that `action` sets, or raises ValidationError when it is missing.'''
+        description, field, value = BULK_UPDATES[action]
+        if value is not None:
+            return value
+
+        if not self.is_valid():
+            raise ValidationError(self.errors.as_text())
+        value = self.cleaned_data[field]
+        if value is None:
+            raise ValidationError(_('Choose a value for "%(field)s".'), params={'field': self.fields[field].label})
+        return value
+
+
+class BusinessActionForm(BusinessUpdateForm, ActionForm):
+    pass
@@ -0,0 +1,327 @@
+from __future__ import unicode_literals
+
+from copy import deepcopy
+import logging
+import re
+import string
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+import openpyxl
+import pyexcel
+
+from core.analytics import notify_businesses_changed
+from core.listings import refresh_business_listings
+from core.models import (
+    Amenity,
+    Business,
+    Sector_DTI_Files,
+    Status,
+)
+from core.references import reference_cache
+from core.search import find_duplicate_businesses
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_XLS_BATCH_SIZE = getattr(settings, 'UPLOAD_XLS_BATCH_SIZE', 1000)
+
+# Columns read by the parser: number, taxpayer, business name, address, barangay, capital
+UPLOAD_XLS_MIN_COLUMNS = 6
+
+
+class BusinessBatch(object):
+    '''
+    Buffers unsaved Business records together with the names of their Amenities
+    and writes them with bulk_create, one chunk of `batch_size` businesses at a time.
+    The Amenities are only built after their parents are inserted, since
+    bulk_create on PostgreSQL is what gives the businesses their primary keys.
+    Each chunk is committed on its own, and `on_flush` is called with the batch
+    inside the transaction of every chunk, so that progress and `rows_committed`
+    (the number of rows read up to the end of the chunk) are saved with it.
+    Businesses that look like one already saved (see find_duplicate_businesses)
+    are listed in `duplicates`, but still created.
+    '''
+
+    def __init__(self, batch_size=None, on_flush=None):
+        self.batch_size = batch_size or UPLOAD_XLS_BATCH_SIZE
+        self.on_flush = on_flush
+        self.pending = []
+        self.rows_processed = 0
+        self.rows_committed = 0
+        self.businesses_created = 0
+        self.amenities_created = 0
+        self.errors = []
+        self.duplicates = []
+        self.years = set()
+
+    def add_business(self, business):
+        # A new business row closes the previous one, so the buffer can be written
+        # without cutting off any amenities that still follow in the sheet.
+        if len(self.pending) >= self.batch_size:
+            # The row of `business` is already counted but belongs to the next chunk
+            self.flush(self.rows_processed - 1)
+        self.pending.append((business, []))
+        return business
+
+    def add_amenity(self, business, name):
+        if not self.pending or self.pending[-1][0] is not business:
+            raise ValueError('Amenity \'{}\' does not follow a pending business.'.format(name))
+        self.pending[-1][1].append(name)
+
+    def flush(self, rows_committed=None):
+        if not self.pending:
+            return
+
+        with transaction.atomic():
+            self.rows_committed = self.rows_processed if rows_committed is None else rows_committed
+
+            # bulk_create does not call save(), which sets the capital bucket
+            for business, amenity_names in self.pending:
+                business.update_capital_bucket()
+
+            businesses = Business.objects.bulk_create(
+                [business for business, amenity_names in self.pending],
+                batch_size=self.batch_size
+            )
+            amenities = Amenity.objects.bulk_create(
+                [Amenity(name=name, establishment=business)
+                 for business, amenity_names in self.pending for name in amenity_names],
+                batch_size=self.batch_size
+            )
+
+            refresh_business_listings(Business.objects.filter(id__in=[business.id for business in businesses]))
+            self.flag_duplicates(businesses)
+            self.years.update(business.year for business in businesses)
+
+            self.businesses_created += len(businesses)
+            self.amenities_created += len(amenities)
+            self.pending = []
+
+            if self.on_flush:
+                self.on_flush(self)
+
+        logger.info('Saved {} businesses and {} amenities ({} businesses so far).'.format(
+            len(businesses), len(amenities), self.businesses_created))
+
+    def flag_duplicates(self, businesses):
+        duplicates = find_duplicate_businesses([business.id for business in businesses])
+        for business in businesses:
+            if business.id in duplicates:
+                duplicate_id, taxpayer_name, business_name, similarity = duplicates[business.id]
+                self.duplicates.append('{} ({}) may duplicate business {}: {} ({}), {:.0%} similar.'.format(
+                    business.taxpayer_name, business.business_name, duplicate_id, taxpayer_name, business_name, similarity))
+
+
+def iter_excel_rows(file_stream, file_type):
+    '''
+    Yields the rows of the first sheet of an .xls/.xlsx file one at a time, with
+    every cell as unicode and short rows padded. An .xlsx sheet is streamed by
+    openpyxl in read-only mode, so the workbook is never held whole; xlrd still
+    loads an .xls workbook whole before the first row.
+    '''
+    file_stream.seek(0)
+    if file_type == 'xlsx':
+        rows = iter_xlsx_rows(file_stream)
+    else:
+        rows = pyexcel.iget_array(file_stream=file_stream, file_type=file_type)
+
+    try:
+        for row in rows:
+            cells = [unicode(cell) for cell in row]
+            if len(cells) < UPLOAD_XLS_MIN_COLUMNS:
+                cells.extend([''] * (UPLOAD_XLS_MIN_COLUMNS - len(cells)))
+            yield cells
+    finally:
+        pyexcel.free_resources()
+
+
+def iter_xlsx_rows(file_stream):
+    # pyexcel-xlsx only opens read-only workbooks when it does not skip hidden
+    # rows, and may not be the plugin pyexcel picks for .xlsx, so openpyxl is used directly
+    book = openpyxl.load_workbook(file_stream, read_only=True, data_only=True)
+    try:
+        for row in book.worksheets[0].iter_rows():
+            yield ['' if cell.value is None else cell.value for cell in row]
+    finally:
+        book.close()
+
+
+def import_business_rows(rows, file_name, batch_size=None, on_flush=None, skip_rows=0):
+    '''
+    Parses the rows of a DTI business list and saves its businesses and amenities
+    in batches. Returns the BusinessBatch holding the number of created rows.
+    The first `skip_rows` rows, committed by an earlier attempt, are only read
+    for the year and sector of the list.
+    '''
+    file_sector = None
+    file_sector_code = None
+    file_status = None
+    batch = BusinessBatch(batch_size, on_flush)
+
+    file_sector_code = get_sector_code_from_file(file_name)[0]
+    file_sector = reference_cache.get(Sector_DTI_Files, code=file_sector_code)
+
+    # For fetching the status defined from the filename. Defaults to "New" status
+    if 'renewal' in file_name.split('.')[0].lower():
+        file_status = reference_cache.get_by_id(Status, Status.RENEWAL)
+    else:
+        file_status = reference_cache.get_by_id(Status, Status.NEW)
+
+    try:
+        add_business_rows(rows, file_name, file_sector, file_sector_code, file_status, batch, skip_rows)
+    finally:
+        # Also covers the batches already committed when an import fails
+        notify_businesses_changed(batch.years)
+
+    logger.info('Finished \'{}\': {} businesses and {} amenities created.'.format(
+        file_name, batch.businesses_created, batch.amenities_created))
+
+    return batch
+
+
+def add_business_rows(rows, file_name, file_sector, file_sector_code, file_status, batch, skip_rows=0):
+    year_issued = None
+    start_create = False
+    current_establishment = None
+
+    for row in rows:
+        batch.rows_processed += 1
+
+        if not start_create:
+            secstat_cell = re.split('[\s()]+', unicode(row[0]).lower())
+
+            if string.join(secstat_cell[:2], '') == 'listof':
+                year_issued = [int(x) for x in secstat_cell if x.isdigit() and (1000 < int(x)< 9999)]
+
+                # For fetching the sector defined inside the file
+                if not file_sector:
+                    file_sector = get_sector_from_file(secstat_cell, file_sector_code)
+
+        check_taxpayer = unicode(row[1]).translate(dict.fromkeys(map(ord, string.punctuation))).lower()
+        if check_taxpayer == 'taxpayers name':
+            start_create = True
+            logger.info('Processing the XLS file \'{}\''.format(file_name))
+            continue
+
+        if batch.rows_processed <= skip_rows:
+            continue
+
+        current_establishment = create_business_and_amenity(
+            row,
+            file_sector,
+            file_status,
+            current_establishment,
+            year_issued,
+            batch
+        )
+
+    batch.flush()
+
+
+def get_sector_code_from_file(file_name):
+    if str(file_name).find('completed') != -1:
+        return re.findall('(.+?)completed', str(file_name))
+
+    elif str(file_name).find('renewal') != -1:
+        return re.findall('(.+?)renewal', str(file_name))
+
+
+def create_business_and_amenity(file_line, file_sector, file_status, current_establishment, year_issued, batch):
+    try:
+        if file_line[0].isdigit():
+
+            # Converted here so that a bad capital is an error of its row, not of the whole chunk
+            business_capital = Business._meta.get_field('capital').to_python(
+                unicode(file_line[5]).translate(dict.fromkeys(map(ord, ','))))
+
+            address_number = unicode(file_line[3]).split(' ')
+            business_address = deepcopy(address_number)
+            business_number = address_number.pop()
+
+            if not business_number.replace('-', '').isdigit():
+                business_number = None
+                business_address = string.join(business_address)
+
+            else:
+                if len(business_number.replace('-', '')) < 7:
+                    business_number = None
+                    business_address = string.join(business_address)
+                else:
+                    business_address = string.join(address_number)
+
+            business = Business(
+                taxpayer_name = file_line[1],
+                business_name = file_line[2],
+                address = business_address,
+                tel_number = business_number,
+                barangay = file_line[4],
+                capital = business_capital,
+                sector_dti_files = file_sector,
+                status= file_status
+            )
+
+            if year_issued:
+                business.year = year_issued[0]
+
+            logger.debug('Queueing Business \'{}({})\''.format(file_line[1], file_line[2]))
+
+            current_establishment = batch.add_business(business)
+
+        elif file_line[0] == '*':
+            batch.add_amenity(current_establishment, file_line[1])
+
+            logger.debug('Queueing Amenity \'{}\' for Business \'{}\''.format(file_line[1], current_establishment.business_name))
+
+        return current_establishment
+
+    except (ValueError, ValidationError) as error:
+        logger.error('Error while creating the database entry for {}'.format(file_line[1]), exc_info=True)
+        message = ' '.join(error.messages) if isinstance(error, ValidationError) else error
+        batch.errors.append('{}: {}'.format(file_line[1], message))
+
+
+def get_status_from_file(file_desc):
+    from_file_status =  re.findall('\d*\s*\((.+?)\)', str(file_desc))[0]
+    number_of_matches = 0
+    file_status_words = from_file_status.split()
+    file_status = None
+
+    for word in file_status_words:
+        file_status = next((status for status in reference_cache.all(Status)
+                            if word.lower() in status.name.lower()), None)
+        if file_status:
+            number_of_matches += 1
+
+    if not float(number_of_matches)/len(file_status_words) > 0.5:
+        file_status = None
+
+    if not file_status:
+        file_status = reference_cache.get_or_create(
+            Status,
+            name=from_file_status.title()
+        )
+
+    return file_status
+
+
+def get_sector_from_file(file_desc_array, file_sector_code):
+    pointer_start = 2
+    if file_desc_array[2] == 'registered':
+        pointer_start = 3
+
+    pointer_end = pointer_start
+    for word in file_desc_array[pointer_start:]:
+        if word == 'in':
+            break
+        pointer_end += 1
+
+    file_sector_name = unicode.title(string.join(file_desc_array[pointer_start:pointer_end], " "))
+    file_sector = reference_cache.get_or_create(
+        Sector_DTI_Files,
+        defaults = {'code': file_sector_code},
+        name = file_sector_name
+    )
+
+    return file_sector
@@ -0,0 +1,151 @@
+from __future__ import unicode_literals
+
+import datetime
+import logging
+import os
+import socket
+import tempfile
+import time
+import traceback
+
+from django.core.files import File
+from django.db import close_old_connections
+from django.utils import timezone
+
+from core.exports import write_business_pdf
+from core.filters import filter_businesses
+from core.ingestion import import_business_rows, iter_excel_rows
+from core.models import Business, ImportJob, PdfExportJob
+from core.references import reference_cache
+
+logger = logging.getLogger(__name__)
+
+
+def run_import_job(job):
+    '''
+    Imports the file of a claimed ImportJob, saving the counts on the job with
+    every committed batch so the admin can follow its progress. A requeued job
+    resumes after the rows committed by its earlier attempts, adding to their
+    counts, and the uploaded file is deleted once the whole file is imported.
+    '''
+    logger.info('Import job {} started for \'{}\' on {}.'.format(job.id, job.file_name, job.worker))
+    if job.rows_committed:
+        logger.info('Import job {} resumes after row {}.'.format(job.id, job.rows_committed))
+
+    def job_progress(batch):
+        return dict(
+            rows_processed=batch.rows_processed,
+            rows_committed=batch.rows_committed,
+            businesses_created=job.businesses_created + batch.businesses_created,
+            amenities_created=job.amenities_created + batch.amenities_created,
+            error_count=job.error_count + len(batch.errors),
+            errors='\n'.join(filter(None, [job.errors] + batch.errors)),
+            duplicate_count=job.duplicate_count + len(batch.duplicates),
+            duplicates='\n'.join(filter(None, [job.duplicates] + batch.duplicates)),
+        )
+
+    def report_progress(batch):
+        # Runs in the transaction of the batch, so the resume point is committed with its rows
+        ImportJob.objects.filter(id=job.id).update(**job_progress(batch))
+
+    # Other processes may have changed the reference tables since the last job
+    reference_cache.drop()
+
+    file_type = job.file_name.split('.')[-1].lower()
+    try:
+        job.file.open('rb')
+        try:
+            batch = import_business_rows(
+                iter_excel_rows(job.file.file, file_type),
+                job.file_name,
+                on_flush=report_progress,
+                skip_rows=job.rows_committed,
+            )
+        finally:
+            job.file.close()
+
+    except Exception:
+        logger.error('Import job {} for \'{}\' failed.'.format(job.id, job.file_name), exc_info=True)
+        # The row errors of the committed batches are kept, and the job can be requeued to resume
+        committed_errors = ImportJob.objects.filter(id=job.id).values_list('errors', flat=True)[0]
+        ImportJob.objects.filter(id=job.id).update(
+            state=ImportJob.STATE_FAILED,
+            errors='\n'.join(filter(None, [committed_errors, traceback.format_exc()])),
+            date_finished=timezone.now(),
+        )
+        return
+
+    job.file.delete(save=False)
+    ImportJob.objects.filter(id=job.id).update(
+        state=ImportJob.STATE_DONE,
+        file='',
+        date_finished=timezone.now(),
+        **job_progress(batch)
+    )
+
+    logger.info('Import job {} finished.'.format(job.id))
+
+
+def run_pdf_export_job(job):
+    '''
+    Renders the businesses matching the job's filters into a PDF saved under
+    MEDIA_ROOT, downloaded through the job admin once done.
+    '''
+    logger.info('PDF export job {} started on {}.'.format(job.id, job.worker))
+
+    file_name = 'dti-sordas-list-of-businesses-{}-{}.pdf'.format(datetime.datetime.now().date(), job.id)
+
+    try:
+        businesses = filter_businesses(Business.objects.all(), job.filters)
+        with tempfile.TemporaryFile() as output:
+            rows_exported = write_business_pdf(output, businesses)
+            job.file.save(file_name, File(output), save=False)
+
+    except Exception:
+        logger.error('PDF export job {} failed.'.format(job.id), exc_info=True)
+        PdfExportJob.objects.filter(id=job.id).update(
+            state=PdfExportJob.STATE_FAILED,
+            errors=traceback.format_exc(),
+            date_finished=timezone.now(),
+        )
+        return
+
+    PdfExportJob.objects.filter(id=job.id).update(
+        state=PdfExportJob.STATE_DONE,
+        file=job.file.name,
+        rows_exported=rows_exported,
+        date_finished=timezone.now(),
+    )
+
+    logger.info('PDF export job {} finished with {} businesses.'.format(job.id, rows_exported))
+
+
+JOB_RUNNERS = (
+    (ImportJob, run_import_job),
+    (PdfExportJob, run_pdf_export_job),
+)
+
+
+def process_jobs(poll_interval=5, once=False):
+    '''
+    Worker loop: claims pending jobs one at a time and runs them. Sleeps
+    `poll_interval` seconds when every queue is empty, or returns if `once` is set.
+    Several of these loops can run side by side in separate processes.
+    '''
+    worker = '{}:{}'.format(socket.gethostname(), os.getpid())
+    logger.info('Job worker {} started.'.format(worker))
+
+    while True:
+        job_ran = False
+
+        for job_model, run_job in JOB_RUNNERS:
+            close_old_connections()
+            job = job_model.claim_next(worker)
+            if job is not None:
+                run_job(job)
+                job_ran = True
+
+        if not job_ran:
+            if once:
+                break
+            time.sleep(poll_interval)
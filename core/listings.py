@@ -0,0 +1,106 @@
+from __future__ import unicode_literals
+
+import logging
+import threading
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.db import connection, transaction
+from django.db.models.sql.datastructures import EmptyResultSet
+
+from core.models import (
+    Business,
+    BusinessListing,
+    Sector_DTI_Files,
+    Sector_DTI_NCCP,
+    Status,
+)
+from core.references import reference_cache
+
+logger = logging.getLogger(__name__)
+
+USE_BUSINESS_LISTING = getattr(settings, 'USE_BUSINESS_LISTING', True)
+
+# References of a business whose names the listing keeps
+LISTING_REFERENCES = {
+    'status': Status,
+    'sector_dti_files': Sector_DTI_Files,
+    'sector_dti_nccp': Sector_DTI_NCCP,
+}
+
+LISTING_COLUMNS = ('business_id', 'status_name', 'sector_dti_files_name', 'sector_dti_nccp_name', 'capital_bucket',
+                   'amenities',)
+
+# Businesses changed in the current thread, refreshed when the transaction commits
+_changed = threading.local()
+
+
+def name_field(reference):
+    '''The lookup of the name of a business's `reference`: from its listing when USE_BUSINESS_LISTING is on.'''
+    return 'listing__{}_name'.format(reference) if USE_BUSINESS_LISTING else '{}__name'.format(reference)
+
+
+def amenities_field():
+    '''The lookup of a business's amenities joined by spaces, or None when they are not read from the listing.'''
+    return 'listing__amenities' if USE_BUSINESS_LISTING else None
+
+
+def refresh_business_listings(businesses):
+    '''
+    Writes the listings of `businesses`, a Business queryset, with one
+    INSERT ... SELECT ... ON CONFLICT DO UPDATE run entirely in the database.
+    '''
+    rows = (businesses.order_by()
+            .values('id', 'status__name', 'sector_dti_files__name', 'sector_dti_nccp__name', 'capital_bucket')
+            .annotate(amenities=StringAgg('amenity__name', delimiter=' ')))
+    try:
+        sql, params = rows.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+
+    updates = ', '.join('{0} = EXCLUDED.{0}'.format(column) for column in LISTING_COLUMNS[1:])
+    with connection.cursor() as cursor:
+        cursor.execute('INSERT INTO {} ({}) {} ON CONFLICT (business_id) DO UPDATE SET {}'.format(
+            BusinessListing._meta.db_table, ', '.join(LISTING_COLUMNS), sql, updates), params)
+        return cursor.rowcount
+
+
+def rebuild_business_listings():
+    with transaction.atomic():
+        refreshed = refresh_business_listings(Business.objects.all())
+    logger.info('Rebuilt the listings of {} businesses.'.format(refreshed))
+    return refreshed
+
+
+def update_listing_names(businesses, reference, pk):
+    '''
+    Sets the `reference` name in the listings of `businesses` to that of the
+    reference `pk`. Call it before updating the businesses themselves, as the
+    update may take them out of the filters of `businesses`.
+    '''
+    name = reference_cache.get_by_id(LISTING_REFERENCES[reference], pk).name if pk else None
+    try:
+        sql, params = businesses.order_by().values('id').query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    return (BusinessListing.objects
+            .extra(where=['{}.business_id IN ({})'.format(BusinessListing._meta.db_table, sql)], params=params)
+            .update(**{'{}_name'.format(reference): name}))
+
+
+def notify_listings_changed(business_ids):
+    '''
+    Marks the listings of `business_ids` as changed by saves of businesses or
+    their amenities. Each listing is refreshed once when the current
+    transaction commits, however many times its business was written.
+    '''
+    pending = _changed.__dict__.setdefault('business_ids', set())
+    pending.update(business_id for business_id in business_ids if business_id is not None)
+    transaction.on_commit(_refresh_changed_listings)
+
+
+def _refresh_changed_listings():
+    # Later callbacks of the same transaction find nothing left to refresh
+    business_ids, _changed.business_ids = getattr(_changed, 'business_ids', set()), set()
+    if business_ids:
+        refresh_business_listings(Business.objects.filter(id__in=business_ids))
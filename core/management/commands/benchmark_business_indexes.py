@@ -0,0 +1,143 @@
+from __future__ import unicode_literals
+
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+
+from core.models import Business, Sector_DTI_NCCP
+
+# Created by migrations 0017_business_query_indexes and 0024_business_year_capital_bucket_index
+QUERY_INDEXES = (
+    'core_business_year_capital_bucket',
+    'core_business_year_barangay',
+    'core_business_year_status',
+    'core_business_year_sector_dti_files',
+    'core_business_year_sector_dti_nccp',
+    'core_business_taxpayer_name_id',
+    'core_business_unverified',
+    'core_business_verified_sector',
+)
+
+# SQL operators of the capital lookups of Business.CAPITAL_BUCKETS
+CAPITAL_LOOKUP_SQL = {'lt': '<', 'lte': '<=', 'gt': '>', 'gte': '>='}
+
+
+def capital_bucket_sql(column):
+    '''A CASE expression giving the capital bucket of `column`, like Business.capital_bucket_of.'''
+    return 'CASE {} END'.format(' '.join(
+        "WHEN {} THEN '{}'".format(' AND '.join(
+            '{} {} {}'.format(column, CAPITAL_LOOKUP_SQL[lookup.split('__')[1]], limit)
+            for lookup, limit in sorted(lookups.items())), bucket)
+        for bucket, label, lookups in Business.CAPITAL_BUCKETS))
+
+
+SYNTHETIC_BUSINESSES_SQL = """
+INSERT INTO core_business (taxpayer_name, business_name, address, barangay, capital, capital_bucket, year,
+                           is_verified, status_id, sector_dti_files_id, sector_dti_nccp_id)
+SELECT 'Taxpayer ' || md5(i::text), 'Business ' || i, 'Street ' || (i %% 997), 'Barangay ' || (i %% 53),
+       capital, {capital_bucket},
+       %(first_year)s + i %% %(years)s, random() < 0.2,
+       status_ids[1 + i %% greatest(cardinality(status_ids), 1)],
+       sector_dti_files_ids[1 + i %% greatest(cardinality(sector_dti_files_ids), 1)],
+       sector_dti_nccp_ids[1 + i %% greatest(cardinality(sector_dti_nccp_ids), 1)]
+FROM (SELECT i, round((random() ^ 4 * 200000000)::numeric, 2) AS capital
+      FROM generate_series(1, %(rows)s) i) synthetic,
+     (SELECT array(SELECT id FROM core_status) AS status_ids,
+             array(SELECT id FROM core_sector_dti_files) AS sector_dti_files_ids,
+             array(SELECT id FROM core_sector_dti_nccp) AS sector_dti_nccp_ids) reference_ids
+""".format(capital_bucket=capital_bucket_sql('capital'))
+
+EXECUTION_TIME = re.compile(r'(?:Execution|Total) (?:Time|runtime): ([\d.]+) ms', re.IGNORECASE)
+
+
+class Rollback(Exception):
+    pass
+
+
+def benchmark_queries(year):
+    '''The query shapes of the business admin, filter_businesses, the analytics and the classifier.'''
+    businesses = Business.objects.all()
+    return [
+        ('Small businesses of a year',
+         businesses.filter(year=year, capital_bucket=Business.CAPITAL_SMALL).values('year').annotate(num_businesses=Count('id'))),
+        ('Businesses per barangay of a year',
+         businesses.filter(year=year).values('barangay').annotate(num_businesses=Count('barangay'))),
+        ('Businesses per DTI-NCCP sector of a year',
+         Sector_DTI_NCCP.objects.filter(business__year=year).annotate(num_businesses=Count('business')).values('name', 'num_businesses')),
+        ('First page of a barangay and year',
+         businesses.filter(year=year, barangay='Barangay 7').order_by('taxpayer_name')[:100]),
+        ('First page of all businesses',
+         businesses.order_by('taxpayer_name', 'id')[:100]),
+        ('Chunk of unverified businesses to classify',
+         businesses.filter(is_verified=False, id__gt=0).order_by('id').values_list('id', 'sector_dti_files__name')[:1000]),
+    ]
+
+
+class Command(BaseCommand):
+    help = ('Prints the EXPLAIN ANALYZE plans and timings of the business list and analytics queries with and '
+            'without the business query indexes, on synthetic businesses added in a transaction that is '
+            'rolled back afterwards. Dropping the indexes locks the business table while it runs, so use a '
+            'copy of the database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000,
+                            help='Number of synthetic businesses to add.')
+        parser.add_argument('--first-year', type=int, default=2010,
+                            help='Year of the oldest synthetic businesses.')
+        parser.add_argument('--years', type=int, default=10,
+                            help='Number of years the synthetic businesses are spread over.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('The index benchmark needs PostgreSQL.')
+
+        year = options['first_year'] + options['years'] - 1
+        timings = []
+
+        try:
+            with transaction.atomic():
+                self.add_synthetic_businesses(options['rows'], options['first_year'], options['years'])
+
+                with_indexes = self.explain_queries(year, 'with indexes')
+
+                with connection.cursor() as cursor:
+                    for index in QUERY_INDEXES:
+                        cursor.execute('DROP INDEX {}'.format(index))
+                    cursor.execute('ANALYZE core_business')
+
+                without_indexes = self.explain_queries(year, 'without indexes')
+                timings = zip(without_indexes, with_indexes)
+                raise Rollback()
+        except Rollback:
+            pass
+
+        self.stdout.write('\n{:<45} {:>12} {:>12}'.format('Query', 'Before (ms)', 'After (ms)'))
+        for (label, before), (_, after) in timings:
+            self.stdout.write('{:<45} {:>12.2f} {:>12.2f}'.format(label, before, after))
+
+    def add_synthetic_businesses(self, rows, first_year, years):
+        started = time.time()
+        with connection.cursor() as cursor:
+            # The search document is not queried here, so it is not computed for the synthetic rows
+            cursor.execute('ALTER TABLE core_business DISABLE TRIGGER core_business_search_document')
+            cursor.execute(SYNTHETIC_BUSINESSES_SQL, {'rows': rows, 'first_year': first_year, 'years': years})
+            cursor.execute('ANALYZE core_business')
+        self.stdout.write('Added {} synthetic businesses in {:.2f}s.'.format(rows, time.time() - started))
+
+    def explain_queries(self, year, description):
+        timings = []
+        with connection.cursor() as cursor:
+            for label, queryset in benchmark_queries(year):
+                sql, params = queryset.query.sql_with_params()
+
+                # The first run warms the cache, so both plans are timed on cached pages
+                cursor.execute(sql, params)
+                cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql, params)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+                self.stdout.write('\n{} ({}):\n{}'.format(label, description, plan))
+                timings.append((label, float(EXECUTION_TIME.search(plan).group(1))))
+        return timings
@@ -0,0 +1,33 @@
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.classifier import classify_businesses_in_parallel
+from core.filters import InvalidFilters, filter_businesses
+from core.models import Business
+
+
+class Command(BaseCommand):
+    help = 'Classifies unverified businesses to DTI-NCCP sectors across a pool of processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filters', default='',
+                            help='Business list filters, in the same format as the export URLs (e.g. "year=2016").')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Number of prediction processes. Defaults to the number of CPUs.')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Number of businesses predicted per chunk.')
+
+    def handle(self, *args, **options):
+        businesses = Business.objects.filter(is_verified=False)
+        try:
+            businesses = filter_businesses(businesses, options['filters'])
+        except InvalidFilters as error:
+            raise CommandError(unicode(error))
+
+        classified = classify_businesses_in_parallel(
+            businesses,
+            processes=options['processes'],
+            chunk_size=options['chunk_size']
+        )
+        self.stdout.write('Classified {} businesses.'.format(classified))
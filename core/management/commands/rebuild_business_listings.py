@@ -0,0 +1,13 @@
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from core.listings import rebuild_business_listings
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the listings read by the business exports and the classifier from every business.'
+
+    def handle(self, *args, **options):
+        refreshed = rebuild_business_listings()
+        self.stdout.write('Rebuilt the listings of {} businesses.'.format(refreshed))
@@ -0,0 +1,13 @@
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from core.analytics import rebuild_business_summary
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the business summary used by the analytics from every business.'
+
+    def handle(self, *args, **options):
+        rebuild_business_summary()
+        self.stdout.write('Rebuilt the business summary.')
@@ -0,0 +1,51 @@
+from __future__ import unicode_literals
+
+import datetime
+import errno
+import os
+import socket
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.jobs import JOB_RUNNERS
+
+
+def worker_is_gone(worker):
+    '''Whether the "host:pid" `worker` ran on this host and its process has exited.'''
+    host, _, pid = (worker or '').rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except OSError as error:
+        return error.errno == errno.ESRCH
+    return False
+
+
+class Command(BaseCommand):
+    help = ('Puts running jobs whose worker died back in the queue. A requeued import resumes after the rows '
+            'it committed. Jobs of workers on this host are requeued once their process is gone; jobs of '
+            'other hosts only with --older-than.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=None,
+                            help='Also requeue the jobs of any host started more than this many minutes ago.')
+        parser.add_argument('--failed', action='store_true', default=False,
+                            help='Also requeue the failed jobs.')
+
+    def handle(self, *args, **options):
+        for job_model, run_job in JOB_RUNNERS:
+            running = job_model.objects.filter(state=job_model.STATE_RUNNING)
+            stale_ids = [job.id for job in running if worker_is_gone(job.worker)]
+
+            if options['older_than'] is not None:
+                started_before = timezone.now() - datetime.timedelta(minutes=options['older_than'])
+                stale_ids.extend(running.filter(date_started__lt=started_before).values_list('id', flat=True))
+
+            jobs = job_model.objects.filter(id__in=stale_ids, state=job_model.STATE_RUNNING)
+            if options['failed']:
+                jobs = jobs | job_model.objects.filter(state=job_model.STATE_FAILED)
+
+            requeued = job_model.requeue(jobs)
+            self.stdout.write('Requeued {} {}.'.format(requeued, job_model._meta.verbose_name_plural))
@@ -0,0 +1,41 @@
+from __future__ import unicode_literals
+
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.jobs import process_jobs
+
+
+class Command(BaseCommand):
+    help = 'Runs worker processes for the queued file imports and PDF exports.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Number of worker processes running jobs in parallel.')
+        parser.add_argument('--poll-interval', type=int, default=5,
+                            help='Seconds to wait before checking an empty queue again.')
+        parser.add_argument('--once', action='store_true', default=False,
+                            help='Exit once the queue is empty instead of waiting for new jobs.')
+
+    def handle(self, *args, **options):
+        worker_options = {
+            'poll_interval': options['poll_interval'],
+            'once': options['once'],
+        }
+
+        if options['processes'] <= 1:
+            process_jobs(**worker_options)
+            return
+
+        # The forked workers must open their own database connections
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=process_jobs, kwargs=worker_options)
+            for _ in xrange(options['processes'])
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,14 @@
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from core.classifier import sector_classifier
+
+
+class Command(BaseCommand):
+    help = 'Fully retrains the DTI-NCCP sector classifier and saves it as a new version.'
+
+    def handle(self, *args, **options):
+        record = sector_classifier.train()
+        self.stdout.write('Saved sector classifier version {} ({} samples in {:.2f}s).'.format(
+            record.id, record.training_samples, record.training_seconds))
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 09:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_auto_20161213_1427'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.IntegerField(choices=[(1, 'Pending'), (2, 'Running'), (3, 'Done'), (4, 'Failed')], default=1, verbose_name='State')),
+                ('worker', models.CharField(blank=True, max_length=100, null=True, verbose_name='Worker')),
+                ('errors', models.TextField(blank=True, null=True, verbose_name='Errors')),
+                ('date_queued', models.DateTimeField(auto_now_add=True, verbose_name='Date Queued')),
+                ('date_started', models.DateTimeField(blank=True, null=True, verbose_name='Date Started')),
+                ('date_finished', models.DateTimeField(blank=True, null=True, verbose_name='Date Finished')),
+                ('file', models.FileField(upload_to='imports/', verbose_name='File')),
+                ('file_name', models.CharField(max_length=255, verbose_name='File Name')),
+                ('rows_processed', models.IntegerField(default=0, verbose_name='Rows Processed')),
+                ('businesses_created', models.IntegerField(default=0, verbose_name='Businesses Created')),
+                ('amenities_created', models.IntegerField(default=0, verbose_name='Amenities Created')),
+                ('error_count', models.IntegerField(default=0, verbose_name='Rows With Errors')),
+            ],
+            options={
+                'verbose_name': 'Import Job',
+                'verbose_name_plural': 'Import Jobs',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 09:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PdfExportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.IntegerField(choices=[(1, 'Pending'), (2, 'Running'), (3, 'Done'), (4, 'Failed')], default=1, verbose_name='State')),
+                ('worker', models.CharField(blank=True, max_length=100, null=True, verbose_name='Worker')),
+                ('errors', models.TextField(blank=True, null=True, verbose_name='Errors')),
+                ('date_queued', models.DateTimeField(auto_now_add=True, verbose_name='Date Queued')),
+                ('date_started', models.DateTimeField(blank=True, null=True, verbose_name='Date Started')),
+                ('date_finished', models.DateTimeField(blank=True, null=True, verbose_name='Date Finished')),
+                ('filters', models.TextField(blank=True, verbose_name='Filters')),
+                ('file', models.FileField(blank=True, null=True, upload_to='exports/', verbose_name='File')),
+                ('rows_exported', models.IntegerField(default=0, verbose_name='Rows Exported')),
+            ],
+            options={
+                'verbose_name': 'PDF Export Job',
+                'verbose_name_plural': 'PDF Export Jobs',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 10:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_pdfexportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SectorClassifier',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(blank=True, max_length=255, verbose_name='File Name')),
+                ('training', models.IntegerField(choices=[(1, 'Full Training'), (2, 'Incremental Update')], verbose_name='Training')),
+                ('training_samples', models.IntegerField(verbose_name='Training Samples')),
+                ('training_seconds', models.FloatField(verbose_name='Training Time (seconds)')),
+                ('date_trained', models.DateTimeField(auto_now_add=True, verbose_name='Date Trained')),
+                ('is_stale', models.BooleanField(default=False, verbose_name='Needs Retraining')),
+            ],
+            options={
+                'verbose_name': 'Sector Classifier Version',
+                'verbose_name_plural': 'Sector Classifier Versions',
+            },
+        ),
+    ]
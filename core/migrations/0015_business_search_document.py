@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# The search document is maintained by triggers and only read through raw SQL
+# in core.search, so it is not a model field and is never loaded with a Business.
+SEARCH_DOCUMENT_SQL = """
+ALTER TABLE core_business ADD COLUMN search_document tsvector;
+
+CREATE FUNCTION core_business_search_document(business core_business) RETURNS tsvector AS $$
+    SELECT
+        setweight(to_tsvector('simple', concat_ws(' ', business.taxpayer_name, business.business_name)), 'A') ||
+        setweight(to_tsvector('simple', concat_ws(' ', business.address, business.barangay, business.tel_number,
+            (SELECT string_agg(amenity.name, ' ') FROM core_amenity amenity WHERE amenity.establishment_id = business.id))), 'B') ||
+        setweight(to_tsvector('simple', concat_ws(' ', business.year,
+            (SELECT status.name FROM core_status status WHERE status.id = business.status_id),
+            (SELECT sector.name FROM core_sector_dti_files sector WHERE sector.id = business.sector_dti_files_id),
+            (SELECT sector.name FROM core_sector_dti_nccp sector WHERE sector.id = business.sector_dti_nccp_id))), 'C')
+$$ LANGUAGE sql STABLE;
+
+CREATE FUNCTION core_business_search_document_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_document := core_business_search_document(NEW);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_business_search_document
+    BEFORE INSERT OR UPDATE OF taxpayer_name, business_name, address, barangay, tel_number, year,
+        status_id, sector_dti_files_id, sector_dti_nccp_id
+    ON core_business FOR EACH ROW EXECUTE PROCEDURE core_business_search_document_update();
+
+CREATE FUNCTION core_amenity_search_document_update() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        UPDATE core_business business SET search_document = core_business_search_document(business)
+        WHERE business.id = OLD.establishment_id;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        UPDATE core_business business SET search_document = core_business_search_document(business)
+        WHERE business.id = NEW.establishment_id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_amenity_search_document
+    AFTER INSERT OR UPDATE OR DELETE ON core_amenity
+    FOR EACH ROW EXECUTE PROCEDURE core_amenity_search_document_update();
+
+-- Renaming a status or sector changes the documents of the businesses pointing to it
+CREATE FUNCTION core_reference_search_document_update() RETURNS trigger AS $$
+BEGIN
+    IF NEW.name IS DISTINCT FROM OLD.name THEN
+        EXECUTE format('UPDATE core_business business SET search_document = core_business_search_document(business) WHERE business.%I = $1', TG_ARGV[0])
+        USING NEW.id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_status_search_document AFTER UPDATE OF name ON core_status
+    FOR EACH ROW EXECUTE PROCEDURE core_reference_search_document_update('status_id');
+CREATE TRIGGER core_sector_dti_files_search_document AFTER UPDATE OF name ON core_sector_dti_files
+    FOR EACH ROW EXECUTE PROCEDURE core_reference_search_document_update('sector_dti_files_id');
+CREATE TRIGGER core_sector_dti_nccp_search_document AFTER UPDATE OF name ON core_sector_dti_nccp
+    FOR EACH ROW EXECUTE PROCEDURE core_reference_search_document_update('sector_dti_nccp_id');
+
+UPDATE core_business business SET search_document = core_business_search_document(business);
+
+CREATE INDEX core_business_search_document_gin ON core_business USING gin (search_document);
+"""
+
+REVERSE_SEARCH_DOCUMENT_SQL = """
+DROP TRIGGER core_sector_dti_nccp_search_document ON core_sector_dti_nccp;
+DROP TRIGGER core_sector_dti_files_search_document ON core_sector_dti_files;
+DROP TRIGGER core_status_search_document ON core_status;
+DROP FUNCTION core_reference_search_document_update();
+DROP TRIGGER core_amenity_search_document ON core_amenity;
+DROP FUNCTION core_amenity_search_document_update();
+DROP TRIGGER core_business_search_document ON core_business;
+DROP FUNCTION core_business_search_document_update();
+DROP FUNCTION core_business_search_document(core_business);
+ALTER TABLE core_business DROP COLUMN search_document;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_sectorclassifier'),
+    ]
+
+    operations = [
+        migrations.RunSQL(SEARCH_DOCUMENT_SQL, REVERSE_SEARCH_DOCUMENT_SQL),
+    ]
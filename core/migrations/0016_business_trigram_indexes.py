@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 11:00
+from __future__ import unicode_literals
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Only the pg_trgm extension and its indexes, so that servers without pg_trgm
+# can fake this migration; the ImportJob fields first added here are in 0026.
+TRIGRAM_INDEXES_SQL = """
+CREATE INDEX core_business_taxpayer_name_trgm ON core_business USING gin (taxpayer_name gin_trgm_ops);
+CREATE INDEX core_business_business_name_trgm ON core_business USING gin (business_name gin_trgm_ops);
+CREATE INDEX core_business_address_trgm ON core_business USING gin (address gin_trgm_ops);
+"""
+
+REVERSE_TRIGRAM_INDEXES_SQL = """
+DROP INDEX core_business_address_trgm;
+DROP INDEX core_business_business_name_trgm;
+DROP INDEX core_business_taxpayer_name_trgm;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_business_search_document'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunSQL(TRIGRAM_INDEXES_SQL, REVERSE_TRIGRAM_INDEXES_SQL),
+    ]
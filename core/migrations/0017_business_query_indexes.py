@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Indexes for the filters of the business admin and filter_businesses, which
+# almost always include a year, and for the per-year analytics. The partial
+# indexes serve the classifier, which pages through unverified businesses by
+# id and trains on the verified ones.
+QUERY_INDEXES_SQL = """
+CREATE INDEX core_business_year_capital ON core_business (year, capital);
+CREATE INDEX core_business_year_barangay ON core_business (year, barangay);
+CREATE INDEX core_business_year_status ON core_business (year, status_id);
+CREATE INDEX core_business_year_sector_dti_files ON core_business (year, sector_dti_files_id);
+CREATE INDEX core_business_year_sector_dti_nccp ON core_business (year, sector_dti_nccp_id);
+CREATE INDEX core_business_taxpayer_name_id ON core_business (taxpayer_name, id);
+CREATE INDEX core_business_unverified ON core_business (id) WHERE NOT is_verified;
+CREATE INDEX core_business_verified_sector ON core_business (sector_dti_nccp_id) WHERE is_verified;
+"""
+
+REVERSE_QUERY_INDEXES_SQL = """
+DROP INDEX core_business_verified_sector;
+DROP INDEX core_business_unverified;
+DROP INDEX core_business_taxpayer_name_id;
+DROP INDEX core_business_year_sector_dti_nccp;
+DROP INDEX core_business_year_sector_dti_files;
+DROP INDEX core_business_year_status;
+DROP INDEX core_business_year_barangay;
+DROP INDEX core_business_year_capital;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_business_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(QUERY_INDEXES_SQL, REVERSE_QUERY_INDEXES_SQL),
+    ]
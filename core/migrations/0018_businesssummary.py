@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 13:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Fills the summary for the businesses that already exist; later changes are
+# applied by core.analytics. The capital buckets are those of Business.CAPITAL_BUCKETS.
+FILL_SUMMARY_SQL = """
+INSERT INTO core_businesssummary (year, status_id, sector_dti_files_id, sector_dti_nccp_id, barangay,
+                                  capital_bucket, num_businesses)
+SELECT year, status_id, sector_dti_files_id, sector_dti_nccp_id, barangay,
+       CASE WHEN capital < 3000000 THEN 'micro'
+            WHEN capital >= 3000000 AND capital <= 15000000 THEN 'small'
+            WHEN capital > 15000000 AND capital <= 100000000 THEN 'medium'
+            WHEN capital > 100000000 THEN 'large'
+       END,
+       count(*)
+FROM core_business
+GROUP BY 1, 2, 3, 4, 5, 6;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_business_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BusinessSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField(db_index=True, verbose_name='Year Issued')),
+                ('barangay', models.CharField(blank=True, max_length=255, null=True, verbose_name='Barangay')),
+                ('capital_bucket', models.CharField(blank=True, choices=[('micro', 'Micro'), ('small', 'Small'), ('medium', 'Medium'), ('large', 'Large')], max_length=10, null=True, verbose_name='Capitalization')),
+                ('num_businesses', models.IntegerField(verbose_name='Number of Businesses')),
+                ('sector_dti_files', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.Sector_DTI_Files', verbose_name='Sector from DTI Files')),
+                ('sector_dti_nccp', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.Sector_DTI_NCCP', verbose_name='Sector from DTI-NCCP')),
+                ('status', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.Status')),
+            ],
+            options={
+                'verbose_name': 'Business Summary',
+                'verbose_name_plural': 'Business Summaries',
+            },
+        ),
+        migrations.RunSQL(FILL_SUMMARY_SQL, migrations.RunSQL.noop),
+    ]
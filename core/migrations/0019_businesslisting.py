@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 14:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Fills the listings of the businesses that already exist; later changes are
+# applied by core.listings. The capital buckets are those of Business.CAPITAL_BUCKETS.
+FILL_LISTINGS_SQL = """
+INSERT INTO core_businesslisting (business_id, status_name, sector_dti_files_name, sector_dti_nccp_name,
+                                  capital_bucket, amenities)
+SELECT business.id, status.name, sector_dti_files.name, sector_dti_nccp.name,
+       CASE WHEN business.capital < 3000000 THEN 'micro'
+            WHEN business.capital >= 3000000 AND business.capital <= 15000000 THEN 'small'
+            WHEN business.capital > 15000000 AND business.capital <= 100000000 THEN 'medium'
+            WHEN business.capital > 100000000 THEN 'large'
+       END,
+       (SELECT string_agg(amenity.name, ' ') FROM core_amenity amenity WHERE amenity.establishment_id = business.id)
+FROM core_business business
+LEFT JOIN core_status status ON status.id = business.status_id
+LEFT JOIN core_sector_dti_files sector_dti_files ON sector_dti_files.id = business.sector_dti_files_id
+LEFT JOIN core_sector_dti_nccp sector_dti_nccp ON sector_dti_nccp.id = business.sector_dti_nccp_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_businesssummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BusinessListing',
+            fields=[
+                ('business', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='listing', serialize=False, to='core.Business')),
+                ('status_name', models.CharField(blank=True, max_length=255, null=True, verbose_name='Status')),
+                ('sector_dti_files_name', models.CharField(blank=True, max_length=255, null=True, verbose_name='Sector from DTI Files')),
+                ('sector_dti_nccp_name', models.CharField(blank=True, max_length=255, null=True, verbose_name='Sector from DTI-NCCP')),
+                ('capital_bucket', models.CharField(blank=True, choices=[('micro', 'Micro'), ('small', 'Small'), ('medium', 'Medium'), ('large', 'Large')], max_length=10, null=True, verbose_name='Capitalization')),
+                ('amenities', models.TextField(blank=True, null=True, verbose_name='Line of Business')),
+            ],
+            options={
+                'verbose_name': 'Business Listing',
+                'verbose_name_plural': 'Business Listings',
+            },
+        ),
+        migrations.RunSQL(FILL_LISTINGS_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 15:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+# Sets the bucket of the businesses that already exist; later saves set it in
+# Business.save(). The capital buckets are those of Business.CAPITAL_BUCKETS.
+FILL_CAPITAL_BUCKET_SQL = """
+UPDATE core_business
+SET capital_bucket = CASE WHEN capital < 3000000 THEN 'micro'
+                          WHEN capital >= 3000000 AND capital <= 15000000 THEN 'small'
+                          WHEN capital > 15000000 AND capital <= 100000000 THEN 'medium'
+                          WHEN capital > 100000000 THEN 'large'
+                     END
+WHERE capital IS NOT NULL;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_businesslisting'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='business',
+            name='capital_bucket',
+            field=models.CharField(blank=True, choices=[('micro', 'Micro'), ('small', 'Small'), ('medium', 'Medium'), ('large', 'Large')], db_index=True, editable=False, max_length=10, null=True, verbose_name='Capitalization'),
+        ),
+        migrations.RunSQL(FILL_CAPITAL_BUCKET_SQL, migrations.RunSQL.noop),
+    ]
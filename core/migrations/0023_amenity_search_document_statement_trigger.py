@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 18:00
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# The amenity trigger of 0015 ran one UPDATE of core_business per amenity, so a
+# bulk_create of a few thousand amenities rewrote each business's search document
+# once per amenity. Statement-level triggers read the changed amenities from
+# transition tables (PostgreSQL 10+) and rewrite each business once per statement.
+# A trigger with transition tables handles a single event, hence three triggers.
+AMENITY_STATEMENT_TRIGGER_SQL = """
+DROP TRIGGER core_amenity_search_document ON core_amenity;
+DROP FUNCTION core_amenity_search_document_update();
+
+CREATE FUNCTION core_amenity_search_document_update() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE core_business business SET search_document = core_business_search_document(business)
+        WHERE business.id IN (SELECT establishment_id FROM new_amenities);
+    ELSIF TG_OP = 'UPDATE' THEN
+        UPDATE core_business business SET search_document = core_business_search_document(business)
+        WHERE business.id IN (SELECT establishment_id FROM old_amenities
+                              UNION SELECT establishment_id FROM new_amenities);
+    ELSE
+        UPDATE core_business business SET search_document = core_business_search_document(business)
+        WHERE business.id IN (SELECT establishment_id FROM old_amenities);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_amenity_search_document_insert AFTER INSERT ON core_amenity
+    REFERENCING NEW TABLE AS new_amenities
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_amenity_search_document_update();
+CREATE TRIGGER core_amenity_search_document_update AFTER UPDATE ON core_amenity
+    REFERENCING OLD TABLE AS old_amenities NEW TABLE AS new_amenities
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_amenity_search_document_update();
+CREATE TRIGGER core_amenity_search_document_delete AFTER DELETE ON core_amenity
+    REFERENCING OLD TABLE AS old_amenities
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_amenity_search_document_update();
+"""
+
+REVERSE_AMENITY_STATEMENT_TRIGGER_SQL = """
+DROP TRIGGER core_amenity_search_document_delete ON core_amenity;
+DROP TRIGGER core_amenity_search_document_update ON core_amenity;
+DROP TRIGGER core_amenity_search_document_insert ON core_amenity;
+DROP FUNCTION core_amenity_search_document_update();
+
+CREATE FUNCTION core_amenity_search_document_update() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        UPDATE core_business business SET search_document = core_business_search_document(business)
+        WHERE business.id = OLD.establishment_id;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        UPDATE core_business business SET search_document = core_business_search_document(business)
+        WHERE business.id = NEW.establishment_id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_amenity_search_document
+    AFTER INSERT OR UPDATE OR DELETE ON core_amenity
+    FOR EACH ROW EXECUTE PROCEDURE core_amenity_search_document_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_cacheversion'),
+    ]
+
+    operations = [
+        migrations.RunSQL(AMENITY_STATEMENT_TRIGGER_SQL, REVERSE_AMENITY_STATEMENT_TRIGGER_SQL),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 19:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+# The capitalization filters now compare capital_bucket, almost always with a
+# year, so the (year, capital) index of 0017 is no longer used by any filter
+# and the single-column index on capital_bucket, with four values, is replaced
+# by one that starts with the year like the other filter indexes.
+YEAR_CAPITAL_BUCKET_INDEX_SQL = """
+CREATE INDEX core_business_year_capital_bucket ON core_business (year, capital_bucket);
+DROP INDEX core_business_year_capital;
+"""
+
+REVERSE_YEAR_CAPITAL_BUCKET_INDEX_SQL = """
+CREATE INDEX core_business_year_capital ON core_business (year, capital);
+DROP INDEX core_business_year_capital_bucket;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_amenity_search_document_statement_trigger'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='business',
+            name='capital_bucket',
+            field=models.CharField(blank=True, choices=[('micro', 'Micro'), ('small', 'Small'), ('medium', 'Medium'), ('large', 'Large')], editable=False, max_length=10, null=True, verbose_name='Capitalization'),
+        ),
+        migrations.RunSQL(YEAR_CAPITAL_BUCKET_INDEX_SQL, REVERSE_YEAR_CAPITAL_BUCKET_INDEX_SQL),
+    ]
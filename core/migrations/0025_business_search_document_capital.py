@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 20:00
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Adds the capital to the search document of 0015, which the changelist search
+# reads instead of the icontains lookups that covered it. The decimal point is
+# split off, so that "1500" and "1500.00" both match words of the document.
+SEARCH_DOCUMENT_CAPITAL_SQL = """
+CREATE OR REPLACE FUNCTION core_business_search_document(business core_business) RETURNS tsvector AS $$
+    SELECT
+        setweight(to_tsvector('simple', concat_ws(' ', business.taxpayer_name, business.business_name)), 'A') ||
+        setweight(to_tsvector('simple', concat_ws(' ', business.address, business.barangay, business.tel_number,
+            (SELECT string_agg(amenity.name, ' ') FROM core_amenity amenity WHERE amenity.establishment_id = business.id))), 'B') ||
+        setweight(to_tsvector('simple', concat_ws(' ', business.year, replace(business.capital::text, '.', ' '),
+            (SELECT status.name FROM core_status status WHERE status.id = business.status_id),
+            (SELECT sector.name FROM core_sector_dti_files sector WHERE sector.id = business.sector_dti_files_id),
+            (SELECT sector.name FROM core_sector_dti_nccp sector WHERE sector.id = business.sector_dti_nccp_id))), 'C')
+$$ LANGUAGE sql STABLE;
+
+DROP TRIGGER core_business_search_document ON core_business;
+CREATE TRIGGER core_business_search_document
+    BEFORE INSERT OR UPDATE OF taxpayer_name, business_name, address, barangay, tel_number, year, capital,
+        status_id, sector_dti_files_id, sector_dti_nccp_id
+    ON core_business FOR EACH ROW EXECUTE PROCEDURE core_business_search_document_update();
+
+UPDATE core_business business SET search_document = core_business_search_document(business)
+WHERE business.capital IS NOT NULL;
+"""
+
+REVERSE_SEARCH_DOCUMENT_CAPITAL_SQL = """
+CREATE OR REPLACE FUNCTION core_business_search_document(business core_business) RETURNS tsvector AS $$
+    SELECT
+        setweight(to_tsvector('simple', concat_ws(' ', business.taxpayer_name, business.business_name)), 'A') ||
+        setweight(to_tsvector('simple', concat_ws(' ', business.address, business.barangay, business.tel_number,
+            (SELECT string_agg(amenity.name, ' ') FROM core_amenity amenity WHERE amenity.establishment_id = business.id))), 'B') ||
+        setweight(to_tsvector('simple', concat_ws(' ', business.year,
+            (SELECT status.name FROM core_status status WHERE status.id = business.status_id),
+            (SELECT sector.name FROM core_sector_dti_files sector WHERE sector.id = business.sector_dti_files_id),
+            (SELECT sector.name FROM core_sector_dti_nccp sector WHERE sector.id = business.sector_dti_nccp_id))), 'C')
+$$ LANGUAGE sql STABLE;
+
+DROP TRIGGER core_business_search_document ON core_business;
+CREATE TRIGGER core_business_search_document
+    BEFORE INSERT OR UPDATE OF taxpayer_name, business_name, address, barangay, tel_number, year,
+        status_id, sector_dti_files_id, sector_dti_nccp_id
+    ON core_business FOR EACH ROW EXECUTE PROCEDURE core_business_search_document_update();
+
+UPDATE core_business business SET search_document = core_business_search_document(business)
+WHERE business.capital IS NOT NULL;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_business_year_capital_bucket_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(SEARCH_DOCUMENT_CAPITAL_SQL, REVERSE_SEARCH_DOCUMENT_CAPITAL_SQL),
+    ]
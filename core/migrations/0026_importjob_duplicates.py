@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 21:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+# These fields were added by 0016 together with the pg_trgm indexes. Databases
+# that applied the earlier 0016 already have the columns, hence IF NOT EXISTS.
+IMPORTJOB_DUPLICATES_SQL = """
+ALTER TABLE core_importjob ADD COLUMN IF NOT EXISTS duplicate_count integer NOT NULL DEFAULT 0;
+ALTER TABLE core_importjob ALTER COLUMN duplicate_count DROP DEFAULT;
+ALTER TABLE core_importjob ADD COLUMN IF NOT EXISTS duplicates text NULL;
+"""
+
+REVERSE_IMPORTJOB_DUPLICATES_SQL = """
+ALTER TABLE core_importjob DROP COLUMN duplicates;
+ALTER TABLE core_importjob DROP COLUMN duplicate_count;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_business_search_document_capital'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(IMPORTJOB_DUPLICATES_SQL, REVERSE_IMPORTJOB_DUPLICATES_SQL),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='importjob',
+                    name='duplicate_count',
+                    field=models.IntegerField(default=0, verbose_name='Possible Duplicates'),
+                ),
+                migrations.AddField(
+                    model_name='importjob',
+                    name='duplicates',
+                    field=models.TextField(blank=True, null=True, verbose_name='Duplicates'),
+                ),
+            ],
+        ),
+    ]
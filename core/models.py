@@ -1,8 +1,10 @@
 from __future__ import unicode_literals
 
 import datetime
+import operator
 
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 optional = {
@@ -34,6 +36,21 @@ class Business(models.Model):
         (OWNERSHIP_FOREIGN, 'Foreign'),
     )
 
+    CAPITAL_MICRO = 'micro'
+    CAPITAL_SMALL = 'small'
+    CAPITAL_MEDIUM = 'medium'
+    CAPITAL_LARGE = 'large'
+    # Asset size classes and the capital lookups of each, shared by the
+    # capitalization filter, the business list filters and the analytics
+    CAPITAL_BUCKETS = (
+        (CAPITAL_MICRO, 'Micro', {'capital__lt': 3000000}),
+        (CAPITAL_SMALL, 'Small', {'capital__gte': 3000000, 'capital__lte': 15000000}),
+        (CAPITAL_MEDIUM, 'Medium', {'capital__gt': 15000000, 'capital__lte': 100000000}),
+        (CAPITAL_LARGE, 'Large', {'capital__gt': 100000000}),
+    )
+    CAPITAL_BUCKET_CHOICES = tuple((bucket, label) for bucket, label, lookups in CAPITAL_BUCKETS)
+    CAPITAL_LOOKUP_OPERATORS = {'lt': operator.lt, 'lte': operator.le, 'gt': operator.gt, 'gte': operator.ge}
+
     taxpayer_name = models.CharField(_("Taxpayer's Name"), max_length=255)
     business_name = models.CharField( _("Business Name"), max_length=255, **optional)
     business_type = models.IntegerField(_("Type of Business"), choices=BUSINESS_TYPE_CHOICES, **optional)
@@ -48,6 +65,10 @@ class Business(models.Model):
     division = models.ForeignKey("Division", **optional)
     year = models.IntegerField(_("Year Issued"), default=datetime.datetime.now().year)
     is_verified = models.BooleanField(default=False, verbose_name="Is Verified")
+    # Stored so that the capitalization filters and breakdowns are equality lookups,
+    # indexed with the year by migration 0024
+    capital_bucket = models.CharField(_("Capitalization"), max_length=10, choices=CAPITAL_BUCKET_CHOICES,
+                                      editable=False, **optional)
 
     class Meta(object):
         verbose_name = _('Business')
@@ -56,6 +77,26 @@ class Business(models.Model):
     def __unicode__(self):
         return "{} ({})".format(self.taxpayer_name, self.business_name)
 
+    def save(self, *args, **kwargs):
+        self.update_capital_bucket()
+        # The pre_save receiver of core.signals locks the row for the summary until the save commits
+        with transaction.atomic():
+            super(Business, self).save(*args, **kwargs)
+
+    @classmethod
+    def capital_bucket_of(cls, capital):
+        '''Returns the CAPITAL_BUCKETS key whose lookups match `capital`, or None.'''
+        if capital is None:
+            return None
+        for bucket, label, lookups in cls.CAPITAL_BUCKETS:
+            if all(cls.CAPITAL_LOOKUP_OPERATORS[lookup.split('__')[1]](capital, limit) for lookup, limit in lookups.items()):
+                return bucket
+        return None
+
+    def update_capital_bucket(self):
+        # The capital is still a string on businesses built from imported rows
+        self.capital_bucket = self.capital_bucket_of(self._meta.get_field('capital').to_python(self.capital))
+
 
 class Amenity(models.Model):
     name = models.CharField(_("Name"), max_length=255)
@@ -96,6 +137,10 @@ class Sector_DTI_NCCP(models.Model):
 
 
 class Status(models.Model):
+    # Statuses assigned from the file name of the uploaded DTI lists
+    NEW = 1
+    RENEWAL = 2
+
     name = models.CharField(_("Name"), max_length=255)
     description = models.TextField(_("Description"), **optional)
 
@@ -132,6 +177,81 @@ class Sector_DTI_NCCP_Dataset(models.Model):
         return unicode(self.id)
 
 
+class BusinessSummary(models.Model):
+    # Businesses counted per combination of the analytics dimensions, rebuilt
+    # one year at a time by core.analytics.refresh_business_summary and
+    # adjusted for single saves by core.analytics.count_business_change
+    year = models.IntegerField(_("Year Issued"), db_index=True)
+    status = models.ForeignKey("Status", **optional)
+    sector_dti_files = models.ForeignKey("Sector_DTI_Files", verbose_name="Sector from DTI Files", **optional)
+    sector_dti_nccp = models.ForeignKey("Sector_DTI_NCCP", verbose_name="Sector from DTI-NCCP", **optional)
+    barangay = models.CharField(_("Barangay"), max_length=255, **optional)
+    capital_bucket = models.CharField(_("Capitalization"), max_length=10, choices=Business.CAPITAL_BUCKET_CHOICES, **optional)
+    num_businesses = models.IntegerField(_("Number of Businesses"))
+
+    class Meta(object):
+        verbose_name = _('Business Summary')
+        verbose_name_plural = _('Business Summaries')
+
+    def __unicode__(self):
+        return "{}: {} businesses".format(self.year, self.num_businesses)
+
+
+class BusinessListing(models.Model):
+    # What the list readers would otherwise join or gather for each business,
+    # kept up to date by core.listings
+    business = models.OneToOneField("Business", primary_key=True, related_name='listing')
+    status_name = models.CharField(_("Status"), max_length=255, **optional)
+    sector_dti_files_name = models.CharField(_("Sector from DTI Files"), max_length=255, **optional)
+    sector_dti_nccp_name = models.CharField(_("Sector from DTI-NCCP"), max_length=255, **optional)
+    capital_bucket = models.CharField(_("Capitalization"), max_length=10, choices=Business.CAPITAL_BUCKET_CHOICES, **optional)
+    amenities = models.TextField(_("Line of Business"), **optional)
+
+    class Meta(object):
+        verbose_name = _('Business Listing')
+        verbose_name_plural = _('Business Listings')
+
+    def __unicode__(self):
+        return "Listing of business {}".format(self.business_id)
+
+
+class CacheVersion(models.Model):
+    # Version counters of the data cached by each process or in the cache
+    # backend, kept in the database where they are never evicted; see core.versions
+    key = models.CharField(_("Key"), max_length=100, primary_key=True)
+    version = models.BigIntegerField(_("Version"), default=0)
+
+    class Meta(object):
+        verbose_name = _('Cache Version')
+        verbose_name_plural = _('Cache Versions')
+
+    def __unicode__(self):
+        return "{} (version {})".format(self.key, self.version)
+
+
+class SectorClassifier(models.Model):
+    TRAINING_FULL = 1
+    TRAINING_UPDATE = 2
+    TRAINING_CHOICES = (
+        (TRAINING_FULL, 'Full Training'),
+        (TRAINING_UPDATE, 'Incremental Update'),
+    )
+
+    file_name = models.CharField(_("File Name"), max_length=255, blank=True)
+    training = models.IntegerField(_("Training"), choices=TRAINING_CHOICES)
+    training_samples = models.IntegerField(_("Training Samples"))
+    training_seconds = models.FloatField(_("Training Time (seconds)"))
+    date_trained = models.DateTimeField(_("Date Trained"), auto_now_add=True)
+    is_stale = models.BooleanField(_("Needs Retraining"), default=False)
+
+    class Meta(object):
+        verbose_name = _('Sector Classifier Version')
+        verbose_name_plural = _('Sector Classifier Versions')
+
+    def __unicode__(self):
+        return "Version {}".format(self.id)
+
+
 class Section(models.Model):
     name = models.CharField(_("Name"), max_length=255)
     description = models.TextField(_("Description"), **optional)
@@ -198,3 +318,92 @@ class PSIC_Subclass(models.Model):
 
     def __unicode__(self):
         return self.code
+
+
+class BackgroundJob(models.Model):
+    STATE_PENDING = 1
+    STATE_RUNNING = 2
+    STATE_DONE = 3
+    STATE_FAILED = 4
+    STATE_CHOICES = (
+        (STATE_PENDING, 'Pending'),
+        (STATE_RUNNING, 'Running'),
+        (STATE_DONE, 'Done'),
+        (STATE_FAILED, 'Failed'),
+    )
+
+    state = models.IntegerField(_("State"), choices=STATE_CHOICES, default=STATE_PENDING)
+    worker = models.CharField(_("Worker"), max_length=100, **optional)
+    errors = models.TextField(_("Errors"), **optional)
+    date_queued = models.DateTimeField(_("Date Queued"), auto_now_add=True)
+    date_started = models.DateTimeField(_("Date Started"), **optional)
+    date_finished = models.DateTimeField(_("Date Finished"), **optional)
+
+    class Meta(object):
+        abstract = True
+
+    @classmethod
+    def claim_next(cls, worker):
+        """
+        Marks the oldest pending job as running for `worker` and returns it. The
+        conditional UPDATE makes sure only one worker process can win a job.
+        """
+        pending = cls.objects.filter(state=cls.STATE_PENDING).order_by('date_queued', 'id')
+        for job_id in pending.values_list('id', flat=True)[:10]:
+            claimed = cls.objects.filter(id=job_id, state=cls.STATE_PENDING).update(
+                state=cls.STATE_RUNNING,
+                worker=worker,
+                date_started=timezone.now(),
+            )
+            if claimed:
+                return cls.objects.get(id=job_id)
+        return None
+
+    @classmethod
+    def requeue(cls, jobs):
+        '''Puts failed or abandoned `jobs` back in the queue. Returns the number of jobs requeued.'''
+        return jobs.exclude(state=cls.STATE_DONE).update(
+            state=cls.STATE_PENDING,
+            worker=None,
+            date_started=None,
+            date_finished=None,
+        )
+
+    @property
+    def elapsed(self):
+        if not self.date_started:
+            return None
+        return (self.date_finished or timezone.now()) - self.date_started
+
+
+class ImportJob(BackgroundJob):
+    file = models.FileField(_("File"), upload_to='imports/')
+    file_name = models.CharField(_("File Name"), max_length=255)
+    rows_processed = models.IntegerField(_("Rows Processed"), default=0)
+    # Rows whose businesses are committed, which a requeued job skips
+    rows_committed = models.IntegerField(_("Rows Committed"), default=0)
+    businesses_created = models.IntegerField(_("Businesses Created"), default=0)
+    amenities_created = models.IntegerField(_("Amenities Created"), default=0)
+    error_count = models.IntegerField(_("Rows With Errors"), default=0)
+    duplicate_count = models.IntegerField(_("Possible Duplicates"), default=0)
+    duplicates = models.TextField(_("Duplicates"), **optional)
+
+    class Meta(object):
+        verbose_name = _('Import Job')
+        verbose_name_plural = _('Import Jobs')
+
+    def __unicode__(self):
+        return "{} ({})".format(self.file_name, self.get_state_display())
+
+
+class PdfExportJob(BackgroundJob):
+    filters = models.TextField(_("Filters"), blank=True)
+    file = models.FileField(_("File"), upload_to='exports/', **optional)
+    rows_exported = models.IntegerField(_("Rows Exported"), default=0)
+
+    class Meta(object):
+        verbose_name = _('PDF Export Job')
+        verbose_name_plural = _('PDF Export Jobs')
+
+    def __unicode__(self):
+        return "PDF export {} ({})".format(self.id, self.get_state_display())
@@ -0,0 +1,63 @@
+from __future__ import unicode_literals
+
+import json
+import uuid
+
+from django.db import connection, transaction
+
+SERVER_SIDE_CHUNK_SIZE = 2000
+
+
+def iterate_server_side(queryset, chunk_size=SERVER_SIDE_CHUNK_SIZE):
+    '''
+    Yields the raw rows of a values_list() queryset through a PostgreSQL named
+    (server-side) cursor, fetching `chunk_size` rows per round trip so that
+    memory stays bounded however many rows match. Field converters are not
+    applied, which is fine for the plain columns the callers select.
+    Other databases fall back to QuerySet.iterator().
+    '''
+    if connection.vendor != 'postgresql':
+        for row in queryset.iterator():
+            yield row
+        return
+
+    sql, params = queryset.query.sql_with_params()
+
+    # Named cursors only live inside a transaction
+    with transaction.atomic():
+        connection.ensure_connection()
+        cursor = connection.connection.cursor(name='sordas_{}'.format(uuid.uuid4().hex))
+        cursor.itersize = chunk_size
+        try:
+            cursor.execute(sql, params)
+            for row in cursor:
+                yield row
+        finally:
+            cursor.close()
+
+
+def estimate_count(queryset):
+    '''
+    Returns the planner's estimate of the number of rows of `queryset` instead
+    of running a COUNT(*): the table's reltuples when it is not filtered, the
+    row estimate of its EXPLAIN plan otherwise. Other databases count exactly.
+    '''
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                           [queryset.model._meta.db_table])
+            estimate = cursor.fetchone()[0]
+            # A table that was never analyzed has no statistics yet
+            if estimate >= 0:
+                return estimate
+
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+
+    if not isinstance(plan, list):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
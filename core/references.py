@@ -0,0 +1,148 @@
+from __future__ import unicode_literals
+
+import time
+import zlib
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from core.models import (
+    Division,
+    PSIC_Class,
+    PSIC_Group,
+    PSIC_Subclass,
+    Section,
+    Sector_DTI_Files,
+    Sector_DTI_NCCP,
+    Status,
+)
+from core.versions import bump_version, get_versions
+
+REFERENCE_MODELS = (
+    Status,
+    Sector_DTI_Files,
+    Sector_DTI_NCCP,
+    Section,
+    Division,
+    PSIC_Group,
+    PSIC_Class,
+    PSIC_Subclass,
+)
+
+# Seconds a process keeps its reference tables before checking whether another process changed them
+REFERENCE_CACHE_CHECK_INTERVAL = getattr(settings, 'REFERENCE_CACHE_CHECK_INTERVAL', 5)
+
+
+def version_key(model):
+    return 'references:{}'.format(model._meta.db_table)
+
+
+class ReferenceCache(object):
+    '''
+    In-process copy of the small reference tables (statuses, sectors and the PSIC
+    tables). Each table is loaded with one query the first time it is used and
+    dropped again by the post_save/post_delete receivers in core.signals, which
+    also bump the version of the table in the database. Every
+    REFERENCE_CACHE_CHECK_INTERVAL seconds the versions are read with one query,
+    so the tables changed by other processes are dropped as well.
+    '''
+
+    def __init__(self):
+        self._tables = {}
+        self._versions = {}
+        self._checked = 0
+
+    def _check_versions(self):
+        if not self._tables or time.time() - self._checked < REFERENCE_CACHE_CHECK_INTERVAL:
+            return
+        versions = get_versions(version_key(model) for model in self._tables)
+        for model in list(self._tables):
+            if versions[version_key(model)] != self._versions.get(model):
+                self.drop(model)
+        self._checked = time.time()
+
+    def _table(self, model):
+        self._check_versions()
+        table = self._tables.get(model)
+        if table is None:
+            # The version is read first: a change committed in between only causes another reload
+            version = get_versions([version_key(model)])[version_key(model)]
+            table = dict((obj.pk, obj) for obj in model.objects.order_by('pk'))
+            self._tables[model] = table
+            self._versions[model] = version
+        return table
+
+    def all(self, model):
+        return sorted(self._table(model).values(), key=lambda obj: obj.pk)
+
+    def get_by_id(self, model, pk):
+        '''
+        Returns the row `pk` of `model`. A row missing from the cached table may
+        have been created since it was loaded, so the table is reloaded once
+        before raising DoesNotExist.
+        '''
+        pk = int(pk)
+        obj = self._table(model).get(pk)
+        if obj is None:
+            self.drop(model)
+            obj = self._table(model).get(pk)
+        if obj is None:
+            raise model.DoesNotExist('{} matching id {} does not exist.'.format(model.__name__, pk))
+        return obj
+
+    def get(self, model, **lookup):
+        '''Returns the first row (by id) whose attributes equal `lookup`, or None.'''
+        for obj in self.all(model):
+            if all(getattr(obj, field) == value for field, value in lookup.items()):
+                return obj
+        return None
+
+    def get_or_create(self, model, defaults=None, **lookup):
+        '''
+        Like QuerySet.get_or_create, but the reference tables have no unique
+        constraints, so concurrent imports are serialized on a PostgreSQL advisory
+        lock for the lookup before checking the database again and creating the row.
+        '''
+        obj = self.get(model, **lookup)
+        if obj is not None:
+            return obj
+
+        with transaction.atomic():
+            lock_reference(model, lookup)
+            obj = model.objects.filter(**lookup).order_by('pk').first()
+            if obj is None:
+                values = dict(lookup)
+                values.update(defaults or {})
+                obj = model.objects.create(**values)
+
+        # Creating the row already bumped the version of the table through the post_save receiver
+        self.drop(model)
+        return obj
+
+    def drop(self, model=None):
+        '''Drops the tables of this process only, to be loaded again when next used.'''
+        if model is None:
+            self._tables.clear()
+            self._versions.clear()
+        else:
+            self._tables.pop(model, None)
+            self._versions.pop(model, None)
+
+    def invalidate(self, model=None):
+        '''Drops `model`, or every reference table, in this process and, through its version, in all the others.'''
+        for changed in [model] if model is not None else REFERENCE_MODELS:
+            bump_version(version_key(changed))
+        self.drop(model)
+
+
+def lock_reference(model, lookup):
+    # The lock is released when the outermost transaction ends
+    if connection.vendor != 'postgresql':
+        return
+    key = '{}:{}'.format(model._meta.db_table, sorted(lookup.items()))
+    lock_id = zlib.crc32(key.encode('utf-8')) & 0x7fffffff
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [lock_id])
+
+
+reference_cache = ReferenceCache()
@@ -0,0 +1,53 @@
+from __future__ import unicode_literals
+
+from core.versions import bump_version, get_version
+
+ROLE_SUPERUSER = 'superuser'
+ROLE_STAFF = 'staff'
+ROLE_VIEWER = 'viewer'
+
+# Members of this group may edit businesses; users in no group or other groups only view them
+STAFF_GROUP = 'Staff'
+
+ROLE_VERSION_KEY = 'roles:version'
+SESSION_ROLE_KEY = 'business_role'
+
+
+def user_role(request):
+    '''
+    Returns the role of the user of `request`. The group membership is queried
+    once per session and kept on the request, and the session copy is dropped
+    whenever invalidate_roles bumps the role version. The version is read from
+    the database on each request, as a version evicted from the cache would
+    let a demoted user keep a role saved under it.
+    '''
+    role = getattr(request, '_business_role', None)
+    if role is not None:
+        return role
+
+    user = request.user
+    if user.is_superuser:
+        role = ROLE_SUPERUSER
+    else:
+        version = get_version(ROLE_VERSION_KEY)
+        session = getattr(request, 'session', None)
+        saved = session.get(SESSION_ROLE_KEY) if session is not None else None
+
+        if saved and saved[:2] == [user.pk, version]:
+            role = saved[2]
+        else:
+            role = ROLE_STAFF if user.groups.filter(name=STAFF_GROUP).exists() else ROLE_VIEWER
+            if session is not None:
+                session[SESSION_ROLE_KEY] = [user.pk, version, role]
+
+    request._business_role = role
+    return role
+
+
+def can_edit_businesses(request):
+    return user_role(request) in (ROLE_SUPERUSER, ROLE_STAFF)
+
+
+def invalidate_roles():
+    '''Drops the roles saved in every session, e.g. when a user joins or leaves a group.'''
+    bump_version(ROLE_VERSION_KEY)
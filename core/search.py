@@ -0,0 +1,133 @@
+from __future__ import unicode_literals
+
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+
+from core.models import Business, Status
+
+SEARCH_CONFIG = 'simple'
+
+# Columns with a pg_trgm GIN index (see migration 0016)
+TRIGRAM_FIELDS = ('taxpayer_name', 'business_name', 'address',)
+
+# Fields searched with icontains on databases without the full-text search document
+BUSINESS_SEARCH_FIELDS = ['taxpayer_name', 'business_name', 'tel_number', 'address', 'barangay', 'year', 'capital',
+                          'status__name', 'sector_dti_files__name', 'sector_dti_nccp__name', 'amenity__name',]
+
+
+def search_businesses(businesses, query_string):
+    '''
+    Filters `businesses` to those whose search document (names, address,
+    barangay, amenities, year, capital, status and sectors; see migrations 0015
+    and 0025) contains
+    every word of `query_string` as a word prefix, using the GIN index on
+    core_business.search_document. Adds a `search_rank` column to order by.
+    '''
+    words = [word for term in normalize_query(query_string) for word in re.findall(r'\w+', term, re.UNICODE)]
+    if not words:
+        return businesses
+
+    if connection.vendor != 'postgresql':
+        businesses = businesses.filter(get_search_query(query_string, BUSINESS_SEARCH_FIELDS)).distinct()
+        return businesses.annotate(search_rank=Value(0, output_field=FloatField()))
+
+    tsquery = ' & '.join("{}:*".format(word.lower()) for word in words)
+    return businesses.extra(
+        select={'search_rank': 'ts_rank(core_business.search_document, to_tsquery(%s, %s))'},
+        select_params=[SEARCH_CONFIG, tsquery],
+        where=['core_business.search_document @@ to_tsquery(%s, %s)'],
+        params=[SEARCH_CONFIG, tsquery],
+    )
+
+
+def find_similar_businesses(name, limit=10, field='taxpayer_name', businesses=None):
+    '''
+    Returns the `limit` businesses whose `field` (one of TRIGRAM_FIELDS) is most
+    similar to `name`, using the pg_trgm GIN indexes, for misspelled names.
+    Matches are those above pg_trgm.similarity_threshold (0.3 by default) and
+    carry their score in a `similarity` column.
+    '''
+    if field not in TRIGRAM_FIELDS:
+        raise ValueError('{} has no trigram index.'.format(field))
+
+    if businesses is None:
+        businesses = Business.objects.all()
+
+    column = 'core_business.{}'.format(field)
+    return businesses.extra(
+        select={'similarity': 'similarity({}, %s)'.format(column)},
+        select_params=[name],
+        where=['{} %% %s'.format(column)],
+        params=[name],
+        order_by=['-similarity'],
+    )[:limit]
+
+
+def find_duplicate_businesses(business_ids):
+    '''
+    Returns a dict mapping each of `business_ids` to the most similar business
+    outside of them whose taxpayer and business names both match by trigram
+    similarity, as (id, taxpayer_name, business_name, similarity). New
+    businesses are compared with those of the same year, and renewals with
+    those of any year, as a renewal is filed under the name registered in an
+    earlier one. All the businesses are checked with one query through the
+    trigram index on taxpayer_name.
+    '''
+    if not business_ids or connection.vendor != 'postgresql':
+        return {}
+
+    with connection.cursor() as cursor:
+        business_ids = list(business_ids)
+        cursor.execute(FIND_DUPLICATES_SQL, [Status.RENEWAL, business_ids, business_ids])
+        return dict((row[0], row[1:]) for row in cursor.fetchall())
+
+
+FIND_DUPLICATES_SQL = """
+SELECT business.id, duplicate.id, duplicate.taxpayer_name, duplicate.business_name, duplicate.similarity
+FROM core_business business
+CROSS JOIN LATERAL (
+    SELECT other.id, other.taxpayer_name, other.business_name,
+           similarity(other.taxpayer_name, business.taxpayer_name) AS similarity
+    FROM core_business other
+    WHERE other.taxpayer_name %% business.taxpayer_name
+      AND other.business_name %% business.business_name
+      AND (business.status_id = %s OR other.year IS NOT DISTINCT FROM business.year)
+      AND other.id <> ALL(%s)
+    ORDER BY similarity DESC, other.id
+    LIMIT 1
+) duplicate
+WHERE business.id = ANY(%s)
+"""
+
+
+def normalize_query(query_string,
+    findterms=re.compile(r'"([^"]+)"|(\S+)').findall,
+    normspace=re.compile(r'\s{2,}').sub):
+
+    return [normspace('',(t[0] or t[1]).strip()) for t in findterms(query_string)]
+
+
+def get_search_query(query_string, search_fields):
+
+    '''
+    Returns a query, that is a combination of Q objects.
+    That combination aims to search keywords within a model by testing the given search fields.
+    '''
+
+    query = None # Query to search for every search term
+    terms = normalize_query(query_string)
+    for term in terms:
+        or_query = None # Query to search for a given term in each field
+        for field_name in search_fields:
+            q = Q(**{"%s__icontains" % field_name: term})
+            if or_query is None:
+                or_query = q
+            else:
+                or_query = or_query | q
+        if query is None:
+            query = or_query
+        else:
+            query = query & or_query
+    return query
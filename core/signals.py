@@ -0,0 +1,141 @@
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+
+from core.analytics import (
+    SUMMARY_DIMENSIONS,
+    count_business_change,
+    invalidate_analytics,
+    notify_businesses_changed,
+    summary_key,
+)
+from core.classifier import sector_classifier
+from core.listings import LISTING_REFERENCES, notify_listings_changed
+from core.models import (
+    Amenity,
+    Business,
+    BusinessListing,
+    ImportJob,
+    PdfExportJob,
+    Sector_DTI_Files,
+    Sector_DTI_NCCP,
+    Sector_DTI_NCCP_Dataset,
+    Status,
+)
+from core.references import REFERENCE_MODELS, reference_cache
+from core.roles import invalidate_roles
+
+
+def invalidate_reference_cache(sender, **kwargs):
+    reference_cache.invalidate(sender)
+
+
+for model in REFERENCE_MODELS:
+    post_save.connect(invalidate_reference_cache, sender=model, dispatch_uid='reference_cache_save_{}'.format(model.__name__))
+    post_delete.connect(invalidate_reference_cache, sender=model, dispatch_uid='reference_cache_delete_{}'.format(model.__name__))
+
+
+def learn_dataset_entry(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        sector_classifier.update([instance.text], [instance.sector_dti_nccp_id])
+    else:
+        # partial_fit can only add the edited sample, not take back what it had taught
+        sector_classifier.invalidate()
+
+
+def retrain_sector_classifier(sender, raw=False, created=True, **kwargs):
+    # Removed samples and new or removed sectors cannot be applied with partial_fit.
+    # post_delete sends no `created`; an edited sector keeps its place in the classifier.
+    if not raw and created:
+        sector_classifier.invalidate()
+
+
+post_save.connect(learn_dataset_entry, sender=Sector_DTI_NCCP_Dataset, dispatch_uid='sector_classifier_learn_dataset')
+post_delete.connect(retrain_sector_classifier, sender=Sector_DTI_NCCP_Dataset, dispatch_uid='sector_classifier_dataset_delete')
+post_save.connect(retrain_sector_classifier, sender=Sector_DTI_NCCP, dispatch_uid='sector_classifier_sector_save')
+post_delete.connect(retrain_sector_classifier, sender=Sector_DTI_NCCP, dispatch_uid='sector_classifier_sector_delete')
+
+
+def remember_saved_summary_key(sender, instance, raw=False, **kwargs):
+    # Read from the row, which is locked until the save or delete commits, as the
+    # instance may have been loaded before a bulk update or classification moved it
+    if raw or instance.pk is None:
+        instance._saved_summary_key = None
+    else:
+        instance._saved_summary_key = (Business.objects.filter(pk=instance.pk).select_for_update()
+                                       .values_list(*SUMMARY_DIMENSIONS).first())
+
+
+def update_business_summary(sender, instance, signal, raw=False, created=False, **kwargs):
+    if raw:
+        notify_businesses_changed([instance.year])
+        return
+    old_key = None if created else getattr(instance, '_saved_summary_key', None)
+    new_key = summary_key(instance) if signal is post_save else None
+    count_business_change(old_key, new_key)
+
+
+pre_save.connect(remember_saved_summary_key, sender=Business, dispatch_uid='business_summary_remember_key')
+pre_delete.connect(remember_saved_summary_key, sender=Business, dispatch_uid='business_summary_remember_key_delete')
+post_save.connect(update_business_summary, sender=Business, dispatch_uid='business_summary_save')
+post_delete.connect(update_business_summary, sender=Business, dispatch_uid='business_summary_delete')
+
+
+def invalidate_analytics_names(sender, **kwargs):
+    # The cached analytics of every year hold the names of the statuses and sectors
+    invalidate_analytics()
+
+
+for model in (Status, Sector_DTI_Files, Sector_DTI_NCCP):
+    post_save.connect(invalidate_analytics_names, sender=model, dispatch_uid='analytics_names_save_{}'.format(model.__name__))
+    post_delete.connect(invalidate_analytics_names, sender=model, dispatch_uid='analytics_names_delete_{}'.format(model.__name__))
+
+
+def invalidate_user_roles(sender, **kwargs):
+    # The roles saved in the sessions follow the group memberships and group names
+    invalidate_roles()
+
+
+m2m_changed.connect(invalidate_user_roles, sender=User.groups.through, dispatch_uid='roles_user_groups')
+post_save.connect(invalidate_user_roles, sender=Group, dispatch_uid='roles_group_save')
+post_delete.connect(invalidate_user_roles, sender=Group, dispatch_uid='roles_group_delete')
+
+
+def update_business_listing(sender, instance, raw=False, **kwargs):
+    if not raw:
+        notify_listings_changed([instance.pk])
+
+
+def update_amenity_listing(sender, instance, raw=False, **kwargs):
+    if not raw:
+        notify_listings_changed([instance.establishment_id])
+
+
+post_save.connect(update_business_listing, sender=Business, dispatch_uid='business_listing_save')
+post_save.connect(update_amenity_listing, sender=Amenity, dispatch_uid='business_listing_amenity_save')
+post_delete.connect(update_amenity_listing, sender=Amenity, dispatch_uid='business_listing_amenity_delete')
+
+
+def rename_listing_references(reference):
+    def rename(sender, instance, raw=False, **kwargs):
+        if not raw:
+            BusinessListing.objects.filter(**{'business__{}'.format(reference): instance}).update(
+                **{'{}_name'.format(reference): instance.name})
+    return rename
+
+
+for reference, model in LISTING_REFERENCES.items():
+    post_save.connect(rename_listing_references(reference), sender=model, weak=False,
+                      dispatch_uid='business_listing_rename_{}'.format(model.__name__))
+
+
+def delete_job_file(sender, instance, **kwargs):
+    if instance.file:
+        instance.file.delete(save=False)
+
+
+post_delete.connect(delete_job_file, sender=ImportJob, dispatch_uid='import_job_delete_file')
+post_delete.connect(delete_job_file, sender=PdfExportJob, dispatch_uid='pdf_export_job_delete_file')
@@ -1,3 +1,459 @@
-from django.test import TestCase
+from __future__ import unicode_literals
 
-# Create your tests here.
+from decimal import Decimal
+import io
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from xlsxwriter.workbook import Workbook
+
+from core.api import business_page, decode_cursor, encode_cursor
+from core.filters import FilterSpec, InvalidFilters
+from core import ingestion
+from core.analytics import rebuild_business_summary
+from core.bulk import BULK_UPDATES, update_businesses
+from core.listings import rebuild_business_listings
+from core.ingestion import import_business_rows, iter_excel_rows
+from core.jobs import run_import_job
+from core.models import (
+    Amenity,
+    Business,
+    BusinessListing,
+    BusinessSummary,
+    ImportJob,
+    Sector_DTI_NCCP,
+    Status,
+)
+from core.references import reference_cache
+from core.search import search_businesses
+
+
+def business_rows(businesses, year=2016):
+    '''The rows of a DTI business list of `businesses`, each a (taxpayer name, capital, amenity names).'''
+    rows = [
+        ['List of registered retail in {} (new)'.format(year), '', '', '', '', ''],
+        ['No.', "Taxpayer's Name", 'Business Name', 'Business Address', 'Barangay', 'Capital'],
+    ]
+    for number, (taxpayer_name, capital, amenity_names) in enumerate(businesses, 1):
+        rows.append([unicode(number), taxpayer_name, '{} Store'.format(taxpayer_name), 'Rizal Street', 'Poblacion',
+                     capital])
+        rows.extend(['*', name, '', '', '', ''] for name in amenity_names)
+    return rows
+
+
+def xlsx_content(rows):
+    output = io.BytesIO()
+    book = Workbook(output)
+    sheet = book.add_worksheet()
+    for number, row in enumerate(rows):
+        sheet.write_row(number, 0, row)
+    book.close()
+    return output.getvalue()
+
+
+def create_statuses():
+    Status.objects.create(id=Status.NEW, name='New')
+    Status.objects.create(id=Status.RENEWAL, name='Renewal')
+    # Tables cached by earlier tests may hold rows rolled back since
+    reference_cache.drop()
+
+
+class FilterSpecTests(SimpleTestCase):
+
+    def test_parse_lookups(self):
+        spec = FilterSpec.parse('year=2016&status__id__exact=2&is_verified__exact=1&capital=small')
+        self.assertEqual(spec.lookups, (('is_verified', True), ('status_id', 2), ('year', 2016)))
+        self.assertEqual(spec.capital, 'small')
+        self.assertIsNone(spec.query)
+        self.assertEqual(spec.ordering, ())
+
+    def test_parse_decodes_values(self):
+        spec = FilterSpec.parse('?barangay=San+Jos%C3%A9&q=sari-sari%20store')
+        self.assertEqual(spec.lookups, (('barangay', 'San Jos\xe9'),))
+        self.assertEqual(spec.query, 'sari-sari store')
+
+    def test_parse_ignores_pagination(self):
+        self.assertEqual(FilterSpec.parse('p=3&all=&year=2016'), FilterSpec.parse('year=2016'))
+        self.assertFalse(FilterSpec.parse('p=3'))
+
+    def test_parse_ignores_changelist_flags(self):
+        self.assertEqual(FilterSpec.parse('year=2016&e=1'), FilterSpec.parse('year=2016'))
+        self.assertEqual(FilterSpec.parse('_popup=1&_to_field=id&year=2016'), FilterSpec.parse('year=2016'))
+
+    def test_parse_rejects_repeated_parameters(self):
+        with self.assertRaises(InvalidFilters):
+            FilterSpec.parse('year=2016&year=2017')
+
+    def test_parse_rejects_unknown_parameters(self):
+        with self.assertRaises(InvalidFilters):
+            FilterSpec.parse('capital__gte=1')
+
+    def test_parse_rejects_invalid_values(self):
+        for filters in ('year=last', 'capital=huge', 'business_type__exact=99', 'is_verified__exact=yes'):
+            with self.assertRaises(InvalidFilters):
+                FilterSpec.parse(filters)
+
+    def test_parse_ordering(self):
+        self.assertEqual(FilterSpec.parse('o=2.-1').ordering, ('business_name', '-taxpayer_name'))
+        self.assertEqual(FilterSpec.parse('o=9.').ordering, ('year',))
+        for ordering in ('0', '-14', 'a'):
+            with self.assertRaises(InvalidFilters):
+                FilterSpec.parse('o={}'.format(ordering))
+
+    def test_equal_specs(self):
+        spec = FilterSpec.parse('year=2016&barangay=Poblacion')
+        same = FilterSpec.parse('barangay=Poblacion&year=2016&p=2')
+        self.assertEqual(spec, same)
+        self.assertEqual(hash(spec), hash(same))
+        self.assertEqual(len({spec, same}), 1)
+        self.assertNotEqual(spec, FilterSpec.parse('year=2016'))
+        self.assertNotEqual(spec, 'year=2016&barangay=Poblacion')
+
+
+class CapitalBucketTests(SimpleTestCase):
+
+    def test_boundaries(self):
+        buckets = [
+            (None, None),
+            (Decimal('0'), Business.CAPITAL_MICRO),
+            (Decimal('2999999.99'), Business.CAPITAL_MICRO),
+            (Decimal('3000000'), Business.CAPITAL_SMALL),
+            (Decimal('15000000'), Business.CAPITAL_SMALL),
+            (Decimal('15000000.01'), Business.CAPITAL_MEDIUM),
+            (Decimal('100000000'), Business.CAPITAL_MEDIUM),
+            (Decimal('100000000.01'), Business.CAPITAL_LARGE),
+        ]
+        for capital, bucket in buckets:
+            self.assertEqual(Business.capital_bucket_of(capital), bucket, capital)
+
+    def test_update_capital_bucket_converts_imported_capital(self):
+        business = Business(capital='15000000.01')
+        business.update_capital_bucket()
+        self.assertEqual(business.capital_bucket, Business.CAPITAL_MEDIUM)
+
+
+class CursorTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        for taxpayer_name, business_id in (('Dela Cruz, Juan', 1), ('Pe\xf1a "Store"', 123456789), ('', 7)):
+            self.assertEqual(decode_cursor(encode_cursor(taxpayer_name, business_id)), (taxpayer_name, business_id))
+
+    def test_invalid_cursors(self):
+        for cursor in ('', 'not a cursor', encode_cursor('name', 'id'), 'WyJhIl0=', '\xf1'):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+
+class BusinessPageTests(SimpleTestCase):
+
+    def test_rejects_page_sizes_below_one(self):
+        for page_size in (0, -1):
+            with self.assertRaises(ValueError):
+                business_page(Business.objects.all(), page_size=page_size)
+
+
+class BusinessBatchTests(TestCase):
+
+    def setUp(self):
+        create_statuses()
+
+    def test_chunks_keep_the_amenities_of_their_businesses(self):
+        businesses = [('Taxpayer {}'.format(number), '1000', ['Amenity {}-{}'.format(number, amenity)
+                                                              for amenity in range(number % 3)])
+                      for number in range(1, 8)]
+        flushes = []
+
+        def on_flush(batch):
+            flushes.append((batch.rows_committed, dict(
+                (business.taxpayer_name, business.amenity_set.count()) for business in Business.objects.all())))
+
+        batch = import_business_rows(business_rows(businesses), 'retailcompleted.xlsx', batch_size=2,
+                                     on_flush=on_flush)
+
+        self.assertEqual([len(saved) for rows_committed, saved in flushes], [2, 4, 6, 7])
+        # Each chunk ends right before the row of the business that starts the next one
+        rows = business_rows(businesses)
+        for rows_committed, saved in flushes[:-1]:
+            self.assertTrue(rows[rows_committed][0].isdigit())
+        self.assertEqual(flushes[-1][0], len(rows))
+        for rows_committed, saved in flushes:
+            for taxpayer_name, amenity_count in saved.items():
+                self.assertEqual(amenity_count, int(taxpayer_name.split()[-1]) % 3)
+        self.assertEqual(batch.errors, [])
+
+    def test_bad_capital_is_an_error_of_its_row(self):
+        businesses = [('Taxpayer 1', '1,500', ['Sari-sari']), ('Taxpayer 2', 'N/A', []),
+                      ('Taxpayer 3', '', []), ('Taxpayer 4', '20,000,000', ['Bakery', 'Cafe'])]
+
+        batch = import_business_rows(business_rows(businesses), 'retailcompleted.xlsx', batch_size=10)
+
+        self.assertEqual(len(batch.errors), 2)
+        self.assertTrue(batch.errors[0].startswith('Taxpayer 2: '))
+        self.assertTrue(batch.errors[1].startswith('Taxpayer 3: '))
+        self.assertEqual(
+            list(Business.objects.order_by('taxpayer_name').values_list('taxpayer_name', 'capital', 'capital_bucket')),
+            [('Taxpayer 1', Decimal('1500'), Business.CAPITAL_MICRO),
+             ('Taxpayer 4', Decimal('20000000'), Business.CAPITAL_MEDIUM)])
+
+    def test_counts(self):
+        businesses = [('Taxpayer {}'.format(number), '1000', ['Amenity'] * number) for number in range(5)]
+
+        batch = import_business_rows(business_rows(businesses), 'retailrenewal.xlsx', batch_size=3)
+
+        self.assertEqual((batch.businesses_created, batch.amenities_created), (5, 10))
+        self.assertEqual((Business.objects.count(), Amenity.objects.count()), (5, 10))
+        self.assertEqual(batch.rows_processed, len(business_rows(businesses)))
+        self.assertEqual(set(Business.objects.values_list('year', 'status', 'sector_dti_files__name')),
+                         {(2016, Status.RENEWAL, 'Retail')})
+
+
+class ReadCountingStream(io.BytesIO):
+
+    def __init__(self, *args, **kwargs):
+        super(ReadCountingStream, self).__init__(*args, **kwargs)
+        self.bytes_read = 0
+
+    def read(self, *args):
+        data = super(ReadCountingStream, self).read(*args)
+        self.bytes_read += len(data)
+        return data
+
+
+class ExcelRowsTests(SimpleTestCase):
+
+    def test_xlsx_rows_are_streamed(self):
+        output = io.BytesIO()
+        book = Workbook(output, {'constant_memory': True})
+        sheet = book.add_worksheet()
+        sheet.write_row(0, 0, ['List of registered retail in 2016 (new)'])
+        for row in range(1, 10000):
+            sheet.write_row(row, 0, [row, 'Taxpayer {}'.format(row), 'Store', 'Rizal Street', 'Poblacion', 1000.5])
+        book.close()
+        stream = ReadCountingStream(output.getvalue())
+
+        rows = iter_excel_rows(stream, 'xlsx')
+        self.assertEqual(next(rows), ['List of registered retail in 2016 (new)', '', '', '', '', ''])
+        self.assertEqual(next(rows), ['1', 'Taxpayer 1', 'Store', 'Rizal Street', 'Poblacion', '1000.5'])
+        self.assertLess(stream.bytes_read, len(stream.getvalue()) / 2)
+
+        self.assertEqual(len(list(rows)), 9998)
+
+
+class ImportJobResumeTests(TestCase):
+
+    def setUp(self):
+        create_statuses()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.batch_size, ingestion.UPLOAD_XLS_BATCH_SIZE = ingestion.UPLOAD_XLS_BATCH_SIZE, 3
+        self.refresh_business_listings = ingestion.refresh_business_listings
+
+    def tearDown(self):
+        ingestion.UPLOAD_XLS_BATCH_SIZE = self.batch_size
+        ingestion.refresh_business_listings = self.refresh_business_listings
+
+    def fail_after_chunks(self, chunks):
+        flushed = []
+
+        def refresh_business_listings(businesses):
+            if len(flushed) == chunks:
+                raise RuntimeError('Worker killed.')
+            flushed.append(businesses)
+            return self.refresh_business_listings(businesses)
+        ingestion.refresh_business_listings = refresh_business_listings
+
+    def test_requeued_job_resumes_after_its_committed_rows(self):
+        # Amenities at every chunk boundary, where a resume point one row off would drop or repeat them
+        businesses = [('Taxpayer {}'.format(number), '1,000', ['Amenity {}-{}'.format(number, amenity)
+                                                               for amenity in range(1 + number % 2)])
+                      for number in range(1, 12)]
+        with override_settings(MEDIA_ROOT=self.media_root):
+            job = ImportJob.objects.create(file=ContentFile(xlsx_content(business_rows(businesses)), 'import.xlsx'),
+                                           file_name='retailcompleted.xlsx', state=ImportJob.STATE_RUNNING)
+
+            self.fail_after_chunks(2)
+            run_import_job(job)
+            job.refresh_from_db()
+            self.assertEqual(job.state, ImportJob.STATE_FAILED)
+            self.assertEqual((job.businesses_created, Business.objects.count()), (6, 6))
+
+            ImportJob.requeue(ImportJob.objects.filter(id=job.id))
+            ingestion.refresh_business_listings = self.refresh_business_listings
+            job.refresh_from_db()
+            run_import_job(job)
+            job.refresh_from_db()
+
+        self.assertEqual(job.state, ImportJob.STATE_DONE)
+        self.assertEqual((job.businesses_created, job.amenities_created, job.error_count), (11, 17, 0))
+        self.assertEqual(
+            sorted((business.taxpayer_name, sorted(business.amenity_set.values_list('name', flat=True)))
+                   for business in Business.objects.all()),
+            sorted((taxpayer_name, sorted(amenity_names)) for taxpayer_name, capital, amenity_names in businesses))
+        self.assertFalse(job.file)
+
+
+class SearchBusinessesTests(TestCase):
+
+    def test_capital(self):
+        business = Business.objects.create(taxpayer_name='Dela Cruz', capital=Decimal('1500.50'), year=2016)
+        Business.objects.create(taxpayer_name='Santos', capital=Decimal('2500'), year=2016)
+
+        for query in ('1500', '1500.50', 'dela 1500'):
+            self.assertEqual(list(search_businesses(Business.objects.all(), query)), [business], query)
+
+        business.capital = Decimal('7000')
+        business.save()
+        self.assertEqual(list(search_businesses(Business.objects.all(), '7000')), [business])
+        self.assertEqual(list(search_businesses(Business.objects.all(), '1500')), [])
+
+
+class BusinessWritesTestCase(TransactionTestCase):
+    '''
+    Writes businesses in committed transactions, so that the refreshes run on
+    commit, and compares what they keep up to date with a full rebuild.
+    '''
+
+    def setUp(self):
+        create_statuses()
+        self.sectors = [Sector_DTI_NCCP.objects.create(name=name, code=name[:3].upper())
+                        for name in ('Retail', 'Services')]
+        self.businesses = [
+            Business.objects.create(taxpayer_name='Taxpayer {}'.format(number), year=2016 + number % 2,
+                                    barangay='Barangay {}'.format(number % 3), capital=Decimal(number * 2000000),
+                                    status_id=Status.NEW, sector_dti_nccp=self.sectors[number % 2],
+                                    is_verified=bool(number % 2))
+            for number in range(1, 9)
+        ]
+        for business in self.businesses[::2]:
+            business.amenity_set.create(name='Sari-sari')
+            business.amenity_set.create(name='Bakery')
+
+    def summary_rows(self):
+        return sorted(BusinessSummary.objects.values_list(
+            'year', 'status', 'sector_dti_files', 'sector_dti_nccp', 'barangay', 'capital_bucket', 'num_businesses'))
+
+    def assertSummaryMatchesRebuild(self):
+        summary_rows = self.summary_rows()
+        rebuild_business_summary()
+        self.assertEqual(summary_rows, self.summary_rows())
+
+    def listing_rows(self):
+        # The order of the amenity names is not defined
+        return sorted(row[:-1] + (sorted((row[-1] or '').split()),) for row in BusinessListing.objects.values_list(
+            'business', 'status_name', 'sector_dti_files_name', 'sector_dti_nccp_name', 'capital_bucket', 'amenities'))
+
+    def assertListingsMatchRebuild(self):
+        listing_rows = self.listing_rows()
+        self.assertEqual(len(listing_rows), Business.objects.count())
+        rebuild_business_listings()
+        self.assertEqual(listing_rows, self.listing_rows())
+
+    def assertSearchDocumentsCurrent(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM core_business business '
+                           'WHERE search_document IS DISTINCT FROM core_business_search_document(business)')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+
+class BusinessSummaryTests(BusinessWritesTestCase):
+
+    def test_single_saves_and_deletes(self):
+        business = self.businesses[0]
+        business.capital = Decimal('50000000')
+        business.barangay = 'Barangay 9'
+        business.save()
+        business.year = 2018
+        business.save()
+        self.businesses[1].delete()
+        Business.objects.create(taxpayer_name='Taxpayer 9', year=2016, status_id=Status.RENEWAL)
+        self.assertSummaryMatchesRebuild()
+
+    def test_stale_instance_saved_after_bulk_update(self):
+        stale = Business.objects.get(pk=self.businesses[0].pk)
+        update_businesses(Business.objects.filter(pk=stale.pk), 'set_year', 2020)
+        update_businesses(Business.objects.filter(pk=stale.pk), 'set_sector', self.sectors[0].pk)
+        self.assertSummaryMatchesRebuild()
+
+        stale.barangay = 'Barangay 9'
+        stale.save()
+        self.assertSummaryMatchesRebuild()
+
+        stale = Business.objects.get(pk=self.businesses[1].pk)
+        update_businesses(Business.objects.filter(pk=stale.pk), 'set_status', Status.RENEWAL)
+        stale.delete()
+        self.assertSummaryMatchesRebuild()
+
+
+class BulkUpdateTests(BusinessWritesTestCase):
+
+    def update(self, action, value=None):
+        businesses = Business.objects.filter(year=2016)
+        self.assertEqual(update_businesses(businesses, action, value), 4)
+        self.assertSummaryMatchesRebuild()
+        self.assertListingsMatchRebuild()
+        self.assertSearchDocumentsCurrent()
+
+    def test_all_actions_are_tested(self):
+        self.assertEqual(set(BULK_UPDATES), {'verify_businesses', 'unverify_businesses', 'set_sector', 'set_status',
+                                             'set_year'})
+
+    def test_verify_businesses(self):
+        self.update('verify_businesses')
+        self.assertEqual(Business.objects.filter(is_verified=False).count(), 0)
+
+    def test_unverify_businesses(self):
+        Business.objects.filter(year=2016).update(is_verified=True)
+        self.update('unverify_businesses')
+        self.assertEqual(Business.objects.filter(is_verified=True).count(), 4)
+
+    def test_set_sector(self):
+        self.update('set_sector', self.sectors[1].pk)
+        self.assertEqual(BusinessListing.objects.filter(sector_dti_nccp_name='Services').count(), 8)
+
+    def test_set_status(self):
+        self.update('set_status', Status.RENEWAL)
+        self.assertEqual(BusinessListing.objects.filter(status_name='Renewal').count(), 4)
+
+    def test_set_year(self):
+        self.update('set_year', 2017)
+        self.assertEqual(BusinessSummary.objects.filter(year=2016).count(), 0)
+
+
+class BusinessListingTests(BusinessWritesTestCase):
+
+    def test_business_saves_and_deletes(self):
+        business = self.businesses[0]
+        business.status_id = Status.RENEWAL
+        business.sector_dti_nccp = None
+        business.capital = Decimal('200000000')
+        business.save()
+        self.businesses[1].delete()
+        Business.objects.create(taxpayer_name='Taxpayer 9', year=2016, sector_dti_nccp=self.sectors[1])
+        self.assertListingsMatchRebuild()
+
+    def test_amenity_saves_and_deletes(self):
+        amenity = self.businesses[2].amenity_set.first()
+        amenity.name = 'Carinderia'
+        amenity.save()
+        self.businesses[0].amenity_set.filter(name='Bakery').delete()
+        self.businesses[3].amenity_set.create(name='Laundry')
+        self.assertListingsMatchRebuild()
+        self.assertEqual(BusinessListing.objects.get(business=self.businesses[3]).amenities, 'Laundry')
+
+    def test_reference_renames(self):
+        status = Status.objects.get(pk=Status.NEW)
+        status.name = 'First Registration'
+        status.save()
+        self.sectors[0].name = 'Wholesale and Retail'
+        self.sectors[0].save()
+        self.assertListingsMatchRebuild()
+        self.assertEqual(BusinessListing.objects.filter(status_name='First Registration').count(), 8)
+
+    def test_bulk_updates(self):
+        for action, value in (('verify_businesses', None), ('set_sector', self.sectors[1].pk),
+                              ('set_status', Status.RENEWAL), ('set_year', 2018), ('unverify_businesses', None)):
+            update_businesses(Business.objects.filter(barangay='Barangay 1'), action, value)
+            self.assertListingsMatchRebuild()
@@ -0,0 +1,27 @@
+from __future__ import unicode_literals
+
+from django.db.models import F
+
+from core.models import CacheVersion
+
+
+def get_versions(keys):
+    '''Returns the version of each of `keys` with one query, 0 for a key never bumped.'''
+    keys = list(keys)
+    versions = dict(CacheVersion.objects.filter(key__in=keys).values_list('key', 'version'))
+    return dict((key, versions.get(key, 0)) for key in keys)
+
+
+def get_version(key):
+    return get_versions([key])[key]
+
+
+def bump_version(key):
+    '''
+    Increments the version of `key`, dropping everything cached under the
+    previous one. The counter lives in the database, so unlike a counter in
+    the cache backend it can never be evicted and restart at an old value.
+    '''
+    if not CacheVersion.objects.filter(key=key).update(version=F('version') + 1):
+        CacheVersion.objects.get_or_create(key=key)
+        CacheVersion.objects.filter(key=key).update(version=F('version') + 1)
@@ -150,6 +150,24 @@ MEDIA_ROOT = os.path.join(FRONTEND_ROOT, 'media')
 FILE_UPLOAD_HANDLERS = ("django_excel.ExcelMemoryFileUploadHandler",
                         "django_excel.TemporaryExcelFileUploadHandler")
 
+# Number of businesses written per bulk INSERT when importing DTI files
+UPLOAD_XLS_BATCH_SIZE = 1000
+
+# Saved versions of the DTI-NCCP sector classifier
+CLASSIFIER_DIR = os.path.join(os.path.dirname(os.path.dirname(PROJECT_ROOT)), 'classifier')
+
+
+# Cache shared by the web and job worker processes, which invalidate the cached analytics
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(os.path.dirname(os.path.dirname(PROJECT_ROOT)), 'cache'),
+    }
+}
+
+# Seconds the analytics of a year stay cached; None keeps them until its businesses change
+ANALYTICS_CACHE_TIMEOUT = None
+
 
 from django.conf.locale.en import formats as en_formats
 en_formats.DATETIME_FORMAT = "m/d/y"
@@ -202,7 +220,7 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': False,
         },
-        'core.views': {
+        'core': {
             'handlers': ['log_file'],
             'level': 'INFO',
             'propagate': False,